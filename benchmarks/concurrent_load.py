@@ -0,0 +1,106 @@
+"""Нагрузочный бенчмарк: N параллельных keep-alive клиентов опрашивают один URL.
+
+Пишет пропускную способность, перцентили задержки, коды ответов и сколько
+байт в среднем занимает ответ. Зависит только от стандартной библиотеки.
+
+Чтобы сравнить «до» и «после», запустите сервис на двух коммитах
+и прогоните одинаковую нагрузку:
+
+    python benchmarks/concurrent_load.py http://localhost:8000/api/v1/posts/ \\
+        --concurrency 200 --duration 30
+    python benchmarks/concurrent_load.py http://localhost:8000/api/v1/users/me \\
+        -H "Authorization: Bearer <access_token>"
+"""
+import argparse
+import asyncio
+import collections
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+async def read_response(reader: asyncio.StreamReader) -> tuple[int, int]:
+    """Прочитать ответ целиком; вернет код ответа и размер тела в байтах."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed by server")
+    status = int(status_line.split()[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if headers.get("transfer-encoding") == "chunked":
+        size = 0
+        while chunk_size := int((await reader.readline()).split(b";")[0], 16):
+            await reader.readexactly(chunk_size + 2)
+            size += chunk_size
+        await reader.readline()
+        return status, size
+    size = int(headers.get("content-length", 0))
+    await reader.readexactly(size)
+    return status, size
+
+
+async def client(url, request: bytes, deadline: float, results: dict) -> None:
+    reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+    try:
+        while time.perf_counter() < deadline:
+            started_at = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status, size = await read_response(reader)
+            results["latencies"].append(time.perf_counter() - started_at)
+            results["statuses"][status] += 1
+            results["bytes"] += size
+    except (ConnectionError, asyncio.IncompleteReadError):
+        results["errors"] += 1
+    finally:
+        writer.close()
+
+
+async def run(args) -> None:
+    url = urlsplit(args.url)
+    path = url.path + (f"?{url.query}" if url.query else "")
+    headers = [f"GET {path} HTTP/1.1", f"Host: {url.netloc}", "Connection: keep-alive"]
+    headers.extend(args.header)
+    request = ("\r\n".join(headers) + "\r\n\r\n").encode()
+    results = {
+        "latencies": [],
+        "statuses": collections.Counter(),
+        "bytes": 0,
+        "errors": 0,
+    }
+    started_at = time.perf_counter()
+    deadline = started_at + args.duration
+    await asyncio.gather(*(
+        client(url, request, deadline, results) for _ in range(args.concurrency)
+    ))
+    elapsed = time.perf_counter() - started_at
+
+    latencies = sorted(results["latencies"])
+    total = len(latencies)
+    if not total:
+        print(f"no successful requests, errors: {results['errors']}")
+        return
+    percentiles = statistics.quantiles(latencies, n=100)
+    print(f"requests:      {total} in {elapsed:.1f}s ({total / elapsed:.0f} req/s)")
+    print(f"latency p50:   {percentiles[49] * 1000:.1f} ms")
+    print(f"latency p90:   {percentiles[89] * 1000:.1f} ms")
+    print(f"latency p99:   {percentiles[98] * 1000:.1f} ms")
+    print(f"body bytes:    {results['bytes'] / total:.0f} per response")
+    print(f"statuses:      {dict(results['statuses'])}")
+    print(f"errors:        {results['errors']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("url")
+    parser.add_argument("-c", "--concurrency", type=int, default=100)
+    parser.add_argument("-d", "--duration", type=float, default=10.0)
+    parser.add_argument("-H", "--header", action="append", default=[],
+                        help="дополнительный заголовок, например 'Accept-Encoding: gzip'")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Бенчмарк профилей JWT: обычного и компактного (JWT_COMPACT_CLAIMS).
+
+Для каждого профиля пишет размер access- и refresh-токена, размер заголовка
+Authorization и время выпуска пары токенов и проверки access-токена
+без кэша проверенных claims — лучшее из --repeat средних, чтобы шум
+соседних процессов не попадал в сравнение. Запускается из корня репозитория:
+
+    python benchmarks/jwt_profiles.py --iterations 20000 --repeat 5
+"""
+import argparse
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.api.v1.schemas import UserProfile  # noqa: E402
+from src.core import config  # noqa: E402
+from src.core.token import create_tokens, decode_token  # noqa: E402
+
+
+def best_time(func: Callable[[], object], iterations: int, repeat: int) -> float:
+    """Лучшее из repeat средних времён вызова, в микросекундах."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        times.append((time.perf_counter() - started) / iterations)
+    return min(times) * 1e6
+
+
+def measure(iterations: int, repeat: int) -> dict:
+    user = UserProfile(uuid=uuid.uuid4(), username="benchmark_user",
+                       email="benchmark_user@example.com", is_superuser=False,
+                       created_at=datetime.utcnow(), version=1)
+    tokens, _ = create_tokens(user)
+    access_token = tokens["access_token"]
+    return {
+        "access_token_bytes": len(access_token),
+        "refresh_token_bytes": len(tokens["refresh_token"]),
+        "header_bytes": len(f"Authorization: Bearer {access_token}\r\n"),
+        "encode_us": best_time(lambda: create_tokens(user), iterations, repeat),
+        "decode_us": best_time(lambda: decode_token(access_token), iterations, repeat),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for name, is_compact in (("full", False), ("compact", True)):
+        config.JWT_COMPACT_CLAIMS = is_compact
+        results[name] = measure(args.iterations, args.repeat)
+
+    print(f"{'':22}{'full':>12}{'compact':>12}")
+    for metric in results["full"]:
+        full, compact = results["full"][metric], results["compact"][metric]
+        print(f"{metric:22}{full:>12.1f}{compact:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
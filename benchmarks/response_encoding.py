@@ -0,0 +1,78 @@
+"""Бенчмарк кодирования ответов: байты и CPU на один ответ списка постов.
+
+Сравнивает сериализацию стандартным json (как было в JSONResponse) и orjson
+(ORJSONResponse), а затем сжатие тела gzip и brotli с настройками из config.
+Запускается из корня репозитория:
+
+    python benchmarks/response_encoding.py --posts 100 --iterations 2000
+
+Сквозной замер на живом сервисе — benchmarks/concurrent_load.py
+с заголовком -H "Accept-Encoding: gzip" и без него.
+"""
+import argparse
+import json
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable
+
+import orjson
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.api.v1.schemas import PostListResponse, PostModel  # noqa: E402
+from src.core import config  # noqa: E402
+from src.core.compression import brotli  # noqa: E402
+
+
+def make_page(size: int) -> PostListResponse:
+    created_at = datetime.utcnow()
+    posts = [
+        PostModel(id=post_id, title=f"Заголовок поста номер {post_id}",
+                  description="Текст поста с обычной для ленты длиной. " * 8,
+                  views=post_id * 7, created_at=created_at + timedelta(seconds=post_id))
+        for post_id in range(size)
+    ]
+    return PostListResponse(posts=posts, next_cursor="WyIyMDI2LTEwLTE3VDEwOjAwOjAwIiwxMDBd")
+
+
+def measure(func: Callable[[], bytes], iterations: int) -> tuple[int, float]:
+    """Вернет размер результата в байтах и среднее время вызова в микросекундах."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        result = func()
+    return len(result), (time.perf_counter() - started) / iterations * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=config.POSTS_PAGE_SIZE)
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    # Оба класса ответа получают уже приведённое jsonable_encoder содержимое
+    content = json.loads(make_page(args.posts).json())
+    body = orjson.dumps(content)
+
+    cases = {
+        # Так сериализует JSONResponse
+        "json": lambda: json.dumps(content, ensure_ascii=False, allow_nan=False,
+                                   separators=(",", ":")).encode(),
+        "orjson": lambda: orjson.dumps(content),
+        "gzip": lambda: zlib.compress(body, config.COMPRESSION_GZIP_LEVEL),
+    }
+    if brotli is not None:
+        cases["brotli"] = lambda: brotli.compress(
+            body, quality=config.COMPRESSION_BROTLI_QUALITY
+        )
+
+    print(f"{'step':10}{'bytes':>10}{'us/response':>14}")
+    for name, func in cases.items():
+        size, duration = measure(func, args.iterations)
+        print(f"{name:10}{size:>10}{duration:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,19 @@
-import redis
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
 
 from src.api.v1.resources import auth, posts, users
-from src.core import config
-from src.db import cache, redis_cache
+from src.core import config, metrics
+from src.core.background import (run_periodically, start_background_task,
+                                 stop_background_tasks)
+from src.core.batching import BatchWriter
+from src.core.compression import CompressionMiddleware
+from src.core.lru import TTLLRUCache
+from src.core.security import start_password_pool, stop_password_pool
+from src.db import (cache, instrumentation, local_cache, redis_cache, redis_pool,
+                    stampede)
+from src.services import flush_post_views, insert_posts
+from src.services import post as post_services
 
 app = FastAPI(
     # Конфигурируем название проекта. Оно будет отображаться в документации
@@ -15,40 +24,120 @@ app = FastAPI(
     redoc_url="/api/redoc",
     # Адрес документации в формате OpenAPI
     openapi_url="/api/openapi.json",
+    # orjson быстрее стандартного json и сам сериализует datetime и UUID
+    default_response_class=ORJSONResponse,
 )
+app.add_middleware(CompressionMiddleware)
+# Добавлен последним, поэтому внешний: в задержку входит и сжатие
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 @app.get("/")
-def root():
+async def root():
     return {"service": config.PROJECT_NAME, "version": config.VERSION}
 
 
+@app.get("/stats", include_in_schema=False)
+async def stats():
+    """Счетчики кэшей и гистограммы SQL-запросов воркера."""
+    return {
+        "cache": cache.cache.stats(),
+        "user_cache": cache.user_cache.stats(),
+        "blocked_access_tokens": cache.blocked_access_tokens_cache.stats(),
+        "active_refresh_tokens": cache.active_refresh_tokens_cache.stats(),
+        "redis_pool": redis_pool.redis_pool.stats(),
+        "post_writer": post_services.post_writer and post_services.post_writer.stats(),
+        "sql": instrumentation.query_stats.stats(),
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics() -> Response:
+    """Метрики в формате Prometheus, со всех воркеров в multiprocess-режиме."""
+    return Response(content=metrics.render_metrics(),
+                    media_type=metrics.CONTENT_TYPE_LATEST)
+
+
 @app.on_event("startup")
-def startup():
+async def startup():
     """Подключаемся к базам при старте сервера"""
-    cache.cache = redis_cache.CacheRedis(
-        cache_instance=redis.Redis(
-            host=config.REDIS_HOST, port=config.REDIS_PORT, max_connections=10
-        )
+    start_password_pool()
+    redis_pool.redis_pool = redis_pool.create_redis_pool()
+    redis_client = redis_pool.create_redis_client(redis_pool.redis_pool)
+    post_redis_cache = redis_cache.CacheRedis(cache_instance=redis_client,
+                                              prefix=config.POST_CACHE_PREFIX)
+    post_cache = local_cache.TwoTierCache(
+        cache_instance=post_redis_cache,
+        local_cache=local_cache.LocalCache(
+            cache_instance=TTLLRUCache(max_entries=config.LOCAL_CACHE_MAX_ENTRIES,
+                                       max_bytes=config.LOCAL_CACHE_MAX_BYTES)
+        ),
+        channel=config.CACHE_INVALIDATION_CHANNEL,
     )
-    cache.blocked_access_tokens_cache = redis_cache.AccessTokenCacheRedis(
-        cache_instance=redis.Redis(
-            host=config.REDIS_HOST, port=config.REDIS_PORT, max_connections=10, db=1
-        )
+    cache.cache = instrumentation.InstrumentedCache(
+        # Блокировки от stampede — сразу в Redis, мимо локального уровня и pub/sub
+        cache_instance=stampede.StampedeProtectedCache(cache_instance=post_cache,
+                                                       lock_cache=post_redis_cache),
+        name="post",
+    )
+    blocked_access_tokens_cache = redis_cache.BloomAccessTokenCacheRedis(
+        cache_instance=redis_client,
+        stream_key=config.BLOCKED_TOKENS_STREAM_KEY,
+        prefix=config.BLOCKED_ACCESS_TOKENS_PREFIX,
+    )
+    cache.blocked_access_tokens_cache = instrumentation.InstrumentedCache(
+        cache_instance=blocked_access_tokens_cache, name="blocked_access_tokens"
     )
     cache.active_refresh_tokens_cache = redis_cache.RefreshTokenCacheRedis(
-        cache_instance=redis.Redis(
-            host=config.REDIS_HOST, port=config.REDIS_PORT, max_connections=10, db=2
+        cache_instance=redis_client, prefix=config.ACTIVE_REFRESH_TOKENS_PREFIX,
+        blocked_tokens_cache=blocked_access_tokens_cache,
+    )
+    cache.post_views_cache = redis_cache.CounterCacheRedis(cache_instance=redis_client)
+    cache.table_versions_cache = redis_cache.CounterCacheRedis(cache_instance=redis_client)
+    user_cache = local_cache.TwoTierCache(
+        cache_instance=redis_cache.VersionedCacheRedis(cache_instance=redis_client,
+                                                       prefix=config.USER_CACHE_PREFIX),
+        local_cache=local_cache.LocalCache(
+            cache_instance=TTLLRUCache(max_entries=config.USER_CACHE_LOCAL_MAX_ENTRIES)
+        ),
+        channel=config.USER_CACHE_INVALIDATION_CHANNEL,
+    )
+    cache.user_cache = instrumentation.InstrumentedCache(cache_instance=user_cache,
+                                                         name="user")
+    if config.POSTS_BATCH_WRITE_ENABLED:
+        post_services.post_writer = BatchWriter(
+            handler=insert_posts,
+            max_size=config.POSTS_BATCH_WRITE_MAX_SIZE,
+            max_delay=config.POSTS_BATCH_WRITE_MAX_DELAY_IN_MS / 1000,
         )
+        start_background_task(post_services.post_writer.run())
+    start_background_task(post_cache.listen())
+    start_background_task(user_cache.listen())
+    start_background_task(blocked_access_tokens_cache.listen())
+    start_background_task(
+        run_periodically(config.POST_VIEWS_FLUSH_INTERVAL_IN_SECONDS, flush_post_views)
+    )
+    start_background_task(
+        run_periodically(config.REFRESH_TOKENS_SWEEP_INTERVAL_IN_SECONDS,
+                         cache.active_refresh_tokens_cache.sweep)
     )
 
 
 @app.on_event("shutdown")
-def shutdown():
+async def shutdown():
     """Отключаемся от баз при выключении сервера"""
-    cache.cache.close()
-    cache.blocked_access_tokens_cache.close()
-    cache.active_refresh_tokens_cache.close()
+    await stop_background_tasks()
+    # Сбрасываем накопленные просмотры, пока соединения ещё открыты
+    await flush_post_views()
+    await cache.cache.close()
+    await cache.blocked_access_tokens_cache.close()
+    await cache.active_refresh_tokens_cache.close()
+    await cache.post_views_cache.close()
+    await cache.table_versions_cache.close()
+    await cache.user_cache.close()
+    await redis_pool.redis_pool.disconnect()
+    stop_password_pool()
+    metrics.mark_process_dead()
 
 
 # Подключаем роутеры к серверу
@@ -15,10 +15,10 @@ router = APIRouter()
     summary="Зарегистрировать пользователя",
     tags=["auth"],
 )
-def user_create(user: SignupUser,
-                auth_service: AuthService = Depends(get_auth_service)) -> dict:
+async def user_create(user: SignupUser,
+                      auth_service: AuthService = Depends(get_auth_service)) -> dict:
     """Вернет информацию о созданном пользователе."""
-    user: dict = auth_service.register_new_user(user=user)
+    user: dict = await auth_service.register_new_user(user=user)
     response = {"msg": "User created."}
     response.update({"user": UserModel(**user)})
     return response
@@ -30,15 +30,16 @@ def user_create(user: SignupUser,
     summary="Авторизовать пользователя",
     tags=["auth"],
 )
-def login(user: AuthUser,
-          auth_service: AuthService = Depends(get_auth_service)) -> Token:
+async def login(user: AuthUser,
+                auth_service: AuthService = Depends(get_auth_service)) -> Token:
     """Вернет access и refresh JWT."""
-    user_data = auth_service.authenticate_user(user)
-    tokens = create_tokens(UserProfile(**user_data))
-    payload = validate_token(tokens.get("refresh_token"))
-    refresh_jti = payload.get("jti")
-    user_uuid = payload.get("user_uuid")
-    auth_service.active_refresh_tokens_cache.add(key=user_uuid, value=refresh_jti)
+    user_data = await auth_service.authenticate_user(user)
+    tokens, claims = create_tokens(UserProfile(**user_data))
+    refresh_jti = claims["refresh_token"]["jti"]
+    user_uuid = claims["refresh_token"]["user_uuid"]
+    await auth_service.active_refresh_tokens_cache.add(
+        key=user_uuid, value=refresh_jti, expire_at=claims["refresh_token"]["exp"]
+    )
     return Token(**tokens)
 
 
@@ -48,15 +49,10 @@ def login(user: AuthUser,
     summary="Обновить токены",
     tags=["auth"],
 )
-def get_new_tokens(refresh_token: str = Depends(oauth2_scheme),
-                   user_service: UserService = Depends(get_user_service)) -> Token:
+async def get_new_tokens(refresh_token: str = Depends(oauth2_scheme),
+                         user_service: UserService = Depends(get_user_service)) -> Token:
     """Вернет обновленные access и refresh JWT."""
-    current_user = user_service.get_current_user(refresh_token, is_refresh_token=True)
-    tokens = create_tokens(UserProfile(**current_user))
-    payload = validate_token(tokens.get("refresh_token"))
-    user_uuid = payload.get("user_uuid")
-    refresh_jti = payload.get("jti")
-    user_service.active_refresh_tokens_cache.add(key=user_uuid, value=refresh_jti)
+    tokens = await user_service.refresh_tokens(refresh_token)
     return Token(**tokens)
 
 
@@ -65,20 +61,20 @@ def get_new_tokens(refresh_token: str = Depends(oauth2_scheme),
     summary="Выйти с текущего устройства",
     tags=["auth"],
 )
-def logout(access_token: str = Depends(oauth2_scheme),
-           auth_service: AuthService = Depends(get_auth_service)) -> dict:
+async def logout(access_token: str = Depends(oauth2_scheme),
+                 auth_service: AuthService = Depends(get_auth_service)) -> dict:
     """Вернет сообщение об успешном выходе из системы с одного устройства."""
     payload = validate_token(access_token)
-    access_jti = payload.get("jti")
-    blocked_token = auth_service.blocked_access_tokens_cache.get(key=access_jti)
-    if blocked_token:
-        # Если токен заблокирован, отдаём 401 статус
+    # Блокировка access-токена и удаление его refresh-токена — один атомарный вызов
+    is_revoked = await auth_service.active_refresh_tokens_cache.revoke(
+        key=payload.get("user_uuid"),
+        access_jti=payload.get("jti"),
+        refresh_jti=payload.get("refresh_jti"),
+    )
+    if not is_revoked:
+        # Если токен уже заблокирован, отдаём 401 статус
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail="the access token is expired")
-    refresh_jti = payload.get("refresh_jti")
-    user_uuid = payload.get("user_uuid")
-    auth_service.blocked_access_tokens_cache.set(key=access_jti, value="block")
-    auth_service.active_refresh_tokens_cache.remove(key=user_uuid, value=refresh_jti)
     return {"msg": "You have been logged out."}
 
 
@@ -87,17 +83,16 @@ def logout(access_token: str = Depends(oauth2_scheme),
     summary="Выйти со всех устройств",
     tags=["auth"],
 )
-def logout_all(access_token: str = Depends(oauth2_scheme),
-               auth_service: AuthService = Depends(get_auth_service)) -> dict:
+async def logout_all(access_token: str = Depends(oauth2_scheme),
+                     auth_service: AuthService = Depends(get_auth_service)) -> dict:
     """Вернет сообщение об успешном выходе из системы со всех устройств."""
     payload = validate_token(access_token)
-    access_jti = payload.get("jti")
-    blocked_token = auth_service.blocked_access_tokens_cache.get(key=access_jti)
-    if blocked_token:
-        # Если токен заблокирован, отдаём 401 статус
+    # Блокировка access-токена и удаление всех сессий — один атомарный вызов
+    is_revoked = await auth_service.active_refresh_tokens_cache.revoke(
+        key=payload.get("user_uuid"), access_jti=payload.get("jti")
+    )
+    if not is_revoked:
+        # Если токен уже заблокирован, отдаём 401 статус
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail="the access token is expired")
-    user_uuid = payload.get("user_uuid")
-    auth_service.blocked_access_tokens_cache.set(key=access_jti, value="block")
-    auth_service.active_refresh_tokens_cache.clear(key=user_uuid)
     return {"msg": "You have been logged out from all devices."}
@@ -1,10 +1,18 @@
 from http import HTTPStatus
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import (APIRouter, Depends, Header, HTTPException, Query, Request,
+                     Response)
+from fastapi.responses import StreamingResponse
 
-from src.api.v1.schemas import PostCreate, PostListResponse, PostModel
-from src.services import PostService, get_post_service, oauth2_scheme
+from src.api.v1.schemas import (PostBatchRequest, PostBatchResponse, PostCreate,
+                                PostImportResponse, PostListResponse, PostModel)
+from src.core import config
+from src.core.compression import accepts_encoding
+from src.core.etag import etag_matches, make_etag, not_modified, set_cache_headers
+from src.services import (PostService, get_post_service,
+                          get_primary_read_post_service, get_read_post_service,
+                          oauth2_scheme)
 
 router = APIRouter()
 
@@ -15,30 +23,128 @@ router = APIRouter()
     summary="Список постов",
     tags=["posts"],
 )
-def post_list(
-    post_service: PostService = Depends(get_post_service),
+async def post_list(
+    response: Response,
+    limit: int = Query(default=config.POSTS_PAGE_SIZE, ge=1,
+                       le=config.POSTS_PAGE_MAX_SIZE),
+    cursor: Optional[str] = Query(default=None,
+                                  description="next_cursor предыдущей страницы"),
+    if_none_match: Optional[str] = Header(default=None),
+    post_service: PostService = Depends(get_primary_read_post_service),
 ) -> PostListResponse:
-    posts: dict = post_service.get_post_list()
+    # ETag страницы меняется вместе с версией таблицы постов, поэтому
+    # неизменившийся список подтверждается без запроса в Postgres.
+    # Версию читаем до страницы и страницу — с основной БД: так страница
+    # не старше версии в её ETag
+    version = await post_service.get_posts_version()
+    etag = make_etag("posts", version, limit, cursor)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    posts: dict = await post_service.get_post_list(limit=limit, cursor=cursor)
     if not posts:
         # Если посты не найдены, отдаём 404 статус
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="posts not found")
+    set_cache_headers(response, etag)
+    return PostListResponse(**posts)
+
+
+@router.get(
+    path="/search",
+    response_model=PostListResponse,
+    summary="Полнотекстовый поиск постов",
+    tags=["posts"],
+)
+async def post_search(
+    q: str = Query(min_length=1, max_length=200,
+                   description="Поисковый запрос в синтаксисе websearch"),
+    limit: int = Query(default=config.POSTS_PAGE_SIZE, ge=1,
+                       le=config.POSTS_PAGE_MAX_SIZE),
+    cursor: Optional[str] = Query(default=None,
+                                  description="next_cursor предыдущей страницы"),
+    post_service: PostService = Depends(get_read_post_service),
+) -> PostListResponse:
+    """Вернет страницу найденных постов, от самых релевантных."""
+    posts: dict = await post_service.search_posts(query=q, limit=limit, cursor=cursor)
     return PostListResponse(**posts)
 
 
+@router.get(
+    path="/export",
+    response_class=StreamingResponse,
+    summary="Выгрузить все посты в NDJSON",
+    tags=["posts"],
+)
+async def post_export(
+    post_service: PostService = Depends(get_read_post_service),
+) -> StreamingResponse:
+    """Вернет все посты потоком, по одному JSON-объекту на строку."""
+    return StreamingResponse(post_service.export_posts(),
+                             media_type="application/x-ndjson")
+
+
+@router.post(
+    path="/batch",
+    response_model=PostBatchResponse,
+    summary="Получить несколько постов по списку id",
+    tags=["posts"],
+)
+async def post_batch(
+    batch: PostBatchRequest, post_service: PostService = Depends(get_read_post_service),
+) -> Response:
+    """Вернет посты в порядке запроса; на месте ненайденных будет null."""
+    posts: bytes = await post_service.get_post_batch(item_ids=batch.ids)
+    return Response(content=posts, media_type="application/json")
+
+
+@router.post(
+    path="/import",
+    response_model=PostImportResponse,
+    summary="Массово загрузить посты из NDJSON",
+    tags=["posts"],
+)
+async def post_import(
+    request: Request, token: str = Depends(oauth2_scheme),
+    post_service: PostService = Depends(get_post_service),
+) -> PostImportResponse:
+    """Тело запроса читается потоком: по одному посту {"title", "description"} на строку.
+
+    Вернет число загруженных постов и ошибки с номерами строк.
+    """
+    result: dict = await post_service.import_posts(lines=request.stream(), token=token)
+    return PostImportResponse(**result)
+
+
 @router.get(
     path="/{post_id}",
     response_model=PostModel,
     summary="Получить определенный пост",
     tags=["posts"],
 )
-def post_detail(
-    post_id: int, post_service: PostService = Depends(get_post_service),
-) -> PostModel:
-    post: Optional[dict] = post_service.get_post_detail(item_id=post_id)
+async def post_detail(
+    post_id: int, if_none_match: Optional[str] = Header(default=None),
+    accept_encoding: Optional[str] = Header(default=None),
+    post_service: PostService = Depends(get_read_post_service),
+) -> Response:
+    # Тело уже сериализовано (и сжато) в кэше, поэтому отдаём его без Pydantic
+    post = await post_service.get_post_detail(item_id=post_id)
     if not post:
         # Если пост не найден, отдаём 404 статус
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="post not found")
-    return PostModel(**post)
+    body, gzipped_body = post
+    # Представление зависит от Accept-Encoding, даже если отдаём его без сжатия
+    if gzipped_body and accepts_encoding(accept_encoding, "gzip"):
+        etag = make_etag(body, "gzip")
+        response = Response(content=gzipped_body, media_type="application/json",
+                            headers={"Content-Encoding": "gzip"})
+    else:
+        etag = make_etag(body)
+        response = Response(content=body, media_type="application/json")
+    if etag_matches(if_none_match, etag):
+        response = not_modified(etag)
+    else:
+        set_cache_headers(response, etag)
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
 
 
 @router.post(
@@ -47,9 +153,9 @@ def post_detail(
     summary="Создать пост",
     tags=["posts"],
 )
-def post_create(
+async def post_create(
     post: PostCreate, token: str = Depends(oauth2_scheme),
     post_service: PostService = Depends(get_post_service),
 ) -> PostModel:
-    post: dict = post_service.create_post(post=post, token=token)
+    post: dict = await post_service.create_post(post=post, token=token)
     return PostModel(**post)
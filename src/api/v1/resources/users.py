@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, Response
 
 from src.api.v1.schemas import UserModel, UserProfile, UserUpdate
-from src.core.token import create_tokens, validate_token
-from src.services import UserService, get_user_service
+from src.core.etag import etag_matches, make_etag, not_modified, set_cache_headers
+from src.services import UserService, get_read_user_service, get_user_service
 from src.services.auth import oauth2_scheme
 
 router = APIRouter()
@@ -13,10 +15,17 @@ router = APIRouter()
     summary="Получить информацию об авторизованном пользователе",
     tags=["users"]
 )
-def get_current_user(access_token: str = Depends(oauth2_scheme),
-                     user_service: UserService = Depends(get_user_service)) -> dict:
+async def get_current_user(response: Response,
+                           if_none_match: Optional[str] = Header(default=None),
+                           access_token: str = Depends(oauth2_scheme),
+                           user_service: UserService = Depends(get_read_user_service)) -> dict:
     """Вернет информацию об авторизованном пользователе."""
-    current_user = user_service.get_current_user(access_token)
+    current_user = await user_service.get_current_user(access_token)
+    # Профиль меняется только через update_user, который увеличивает его версию
+    etag = make_etag("user", current_user["uuid"], current_user["version"])
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_cache_headers(response, etag)
     return {"user": UserProfile(**current_user)}
 
 
@@ -25,16 +34,12 @@ def get_current_user(access_token: str = Depends(oauth2_scheme),
     summary="Обновить информацию авторизованного пользователя",
     tags=["users"]
 )
-def update_current_user(new_data: UserUpdate,
-                        access_token: str = Depends(oauth2_scheme),
-                        user_service: UserService = Depends(get_user_service)) -> dict:
+async def update_current_user(new_data: UserUpdate,
+                              access_token: str = Depends(oauth2_scheme),
+                              user_service: UserService = Depends(get_user_service)) -> dict:
     """Вернет обновленную информацию авторизованного пользователя."""
-    updated_user = user_service.update_user(access_token=access_token, new_data=new_data)
-    new_tokens = create_tokens(UserProfile(**updated_user))
-    payload = validate_token(new_tokens.get("refresh_token"))
-    user_uuid = payload.get("user_uuid")
-    refresh_jti = payload.get("jti")
-    user_service.active_refresh_tokens_cache.add(key=user_uuid, value=refresh_jti)
+    updated_user, new_tokens = await user_service.update_user(access_token=access_token,
+                                                              new_data=new_data)
     response = {"msg": "Update is successful. Please use new access token."}
     response.update({"user": UserModel(**updated_user).dict()})
     response.update(new_tokens)
@@ -1,11 +1,18 @@
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, validator
+
+from src.core import config
 
 __all__ = (
     "PostModel",
     "PostCreate",
     "PostListResponse",
+    "PostBatchRequest",
+    "PostBatchResponse",
+    "PostImport",
+    "PostImportResponse",
 )
 
 
@@ -20,8 +27,44 @@ class PostCreate(PostBase):
 
 class PostModel(PostBase):
     id: int
+    views: int = 0
     created_at: datetime
 
 
 class PostListResponse(BaseModel):
     posts: list[PostModel] = []
+    next_cursor: Optional[str] = None
+
+
+class PostBatchRequest(BaseModel):
+    ids: list[int] = Field(min_items=1, max_items=config.POSTS_BATCH_MAX_SIZE)
+
+
+class PostBatchResponse(BaseModel):
+    # Посты в порядке запроса, null на месте ненайденных
+    posts: list[Optional[PostModel]] = []
+    not_found: list[int] = []
+
+
+class PostImport(PostCreate):
+    # При переносе из других систем дата создания сохраняется
+    created_at: Optional[datetime] = None
+
+    @validator("created_at")
+    def to_naive_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        # Колонка created_at без часового пояса и хранит UTC
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
+class PostImportError(BaseModel):
+    line: int
+    errors: list[dict]
+
+
+class PostImportResponse(BaseModel):
+    inserted: int = 0
+    failed: int = 0
+    # Первые POSTS_IMPORT_MAX_ERRORS ошибок с номерами строк
+    errors: list[PostImportError] = []
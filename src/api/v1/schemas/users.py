@@ -30,6 +30,7 @@ class UserProfile(BaseModel):
     email: str
     is_superuser: bool
     created_at: datetime
+    version: int = 1
 
 
 class UserUpdate(BaseModel):
@@ -0,0 +1,34 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Coroutine, NoReturn
+
+__all__ = ("run_periodically", "start_background_task", "stop_background_tasks")
+
+logger = logging.getLogger(__name__)
+
+# Фоновые задачи воркера; ссылки держим, чтобы задачи не собрал GC
+background_tasks: set[asyncio.Task] = set()
+
+
+def start_background_task(coroutine: Coroutine) -> asyncio.Task:
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    return task
+
+
+async def stop_background_tasks() -> None:
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
+
+async def run_periodically(interval: float,
+                           func: Callable[[], Awaitable]) -> NoReturn:
+    """Вызывать func каждые interval секунд; ошибки логируются, цикл не падает."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await func()
+        except Exception:
+            logger.exception("periodic task %s failed", func)
@@ -0,0 +1,86 @@
+import asyncio
+from typing import Awaitable, Callable, Generic, NoReturn, TypeVar
+
+__all__ = ("BatchWriter",)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class BatchWriter(Generic[T, R]):
+    """Собирает элементы из разных запросов и обрабатывает их одной пачкой.
+
+    handler получает список элементов и возвращает результаты в том же порядке.
+    Пачка уходит, как только набралось max_size элементов или прошло
+    max_delay секунд с первого из них.
+    """
+
+    def __init__(self, handler: Callable[[list[T]], Awaitable[list[R]]],
+                 max_size: int, max_delay: float):
+        self.handler = handler
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.queue: asyncio.Queue[tuple[T, asyncio.Future]] = asyncio.Queue()
+        self.batches: int = 0
+        self.items: int = 0
+
+    async def submit(self, item: T) -> R:
+        """Поставить элемент в очередь и дождаться его результата."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def run(self) -> NoReturn:
+        """Фоновый цикл записи; при отмене дописывает то, что уже в очереди."""
+        loop = asyncio.get_running_loop()
+        batch: list[tuple[T, asyncio.Future]] = []
+        try:
+            while True:
+                batch.append(await self.queue.get())
+                deadline = loop.time() + self.max_delay
+                while len(batch) < self.max_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                pending, batch = batch, []
+                await self._flush(pending)
+        except asyncio.CancelledError:
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            if batch:
+                await self._flush(batch)
+            raise
+
+    async def _flush(self, batch: list[tuple[T, asyncio.Future]]) -> None:
+        # Запросы, которые перестали ждать, в пачку не попадают
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if not batch:
+            return
+        try:
+            results = await self.handler([item for item, _ in batch])
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as error:
+            # Ошибка пачки достаётся каждому ожидающему запросу
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "queued": self.queue.qsize(),
+        }
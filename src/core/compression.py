@@ -0,0 +1,151 @@
+import zlib
+from typing import Callable, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.core import config
+
+try:
+    import brotli
+except ImportError:
+    # brotli необязателен: без него ответы сжимаются только gzip
+    brotli = None
+
+__all__ = ("CompressionMiddleware", "accepts_encoding", "gzip_compress")
+
+COMPRESSIBLE_CONTENT_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def parse_accept_encoding(accept_encoding: str) -> dict[str, float]:
+    encodings = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name.strip():
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+
+def accepts_encoding(accept_encoding: Optional[str], encoding: str) -> bool:
+    """Принимает ли клиент кодировку по заголовку Accept-Encoding."""
+    if not accept_encoding:
+        return False
+    return parse_accept_encoding(accept_encoding).get(encoding, 0.0) > 0
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    encodings = parse_accept_encoding(accept_encoding)
+    if brotli is not None and encodings.get("br", 0.0) > 0:
+        return "br"
+    if encodings.get("gzip", 0.0) > 0:
+        return "gzip"
+    return None
+
+
+def gzip_compress(data: bytes) -> bytes:
+    compressor = zlib.compressobj(config.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def make_compressor(encoding: str) -> tuple[Callable[[bytes], bytes], Callable[[], bytes]]:
+    """Вернет функции сжатия очередного куска и завершения потока."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=config.COMPRESSION_BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    # wbits=31 — поток с заголовком gzip
+    compressor = zlib.compressobj(config.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+class CompressionMiddleware:
+    """Сжимает ответы в brotli или gzip по Accept-Encoding клиента.
+
+    Как есть проходят ответы меньше minimum_size, несжимаемых типов и уже
+    сжатые, с Content-Encoding (например, готовые тела из кэша постов).
+    Потоковые ответы сжимаются по кускам.
+    """
+
+    def __init__(self, app: ASGIApp,
+                 minimum_size: int = config.COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    def __init__(self, send: Send, encoding: str, minimum_size: int):
+        self.next_send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message: Optional[Message] = None
+        self.is_passthrough = False
+        self.compress: Optional[Callable[[bytes], bytes]] = None
+        self.finish: Optional[Callable[[], bytes]] = None
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # Заголовки отправим, когда по первому куску тела станет ясно,
+            # сжимать ли ответ
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body" or self.is_passthrough:
+            await self.next_send(message)
+            return
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start_message is not None and not self.should_compress(body, more_body):
+            self.is_passthrough = True
+            await self.next_send(self.start_message)
+            await self.next_send(message)
+            return
+        if self.compress is None:
+            self.compress, self.finish = make_compressor(self.encoding)
+        data = self.compress(body)
+        if not more_body:
+            data += self.finish()
+        if self.start_message is not None:
+            await self.send_start(content_length=None if more_body else len(data))
+        if data or not more_body:
+            await self.next_send({"type": "http.response.body", "body": data,
+                                  "more_body": more_body})
+
+    def should_compress(self, body: bytes, more_body: bool) -> bool:
+        headers = Headers(raw=self.start_message["headers"])
+        if "content-encoding" in headers:
+            return False
+        if not headers.get("content-type", "").startswith(COMPRESSIBLE_CONTENT_TYPES):
+            return False
+        # Потоковый ответ сжимаем всегда, цельный — от minimum_size
+        return more_body or len(body) >= self.minimum_size
+
+    async def send_start(self, content_length: Optional[int]) -> None:
+        start_message, self.start_message = self.start_message, None
+        headers = MutableHeaders(raw=start_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if content_length is not None:
+            headers["Content-Length"] = str(content_length)
+        elif "content-length" in headers:
+            del headers["content-length"]
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            # Сжатое представление уже не побайтно то же, что и исходное
+            headers["ETag"] = f"W/{etag}"
+        await self.next_send(start_message)
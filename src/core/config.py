@@ -8,15 +8,103 @@ JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "foo")
 JWT_ALGORITHM: str = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_EXPIRE_IN_MINUTES: int = 15
 JWT_REFRESH_EXPIRE_IN_DAYS: int = 30
+# Сколько проверенных токенов держать в памяти воркера
+JWT_CLAIMS_CACHE_MAX_ENTRIES: int = int(os.getenv("JWT_CLAIMS_CACHE_MAX_ENTRIES", 10000))
+# Выпускать токены в компактном профиле: короткие имена claims, UUID в base64
+# и только claims для авторизации. Проверяются оба профиля независимо от флага
+JWT_COMPACT_CLAIMS: bool = os.getenv("JWT_COMPACT_CLAIMS", "false").lower() == "true"
+
+# Хеширование паролей: число процессов bcrypt и сколько запросов может ждать
+# своей очереди, прежде чем новые получат 503
+PASSWORD_HASHING_WORKERS: int = int(os.getenv("PASSWORD_HASHING_WORKERS", 2))
+PASSWORD_HASHING_QUEUE_SIZE: int = int(os.getenv("PASSWORD_HASHING_QUEUE_SIZE", 32))
 
 # Название проекта. Используется в Swagger-документации
 PROJECT_NAME: str = os.getenv("PROJECT_NAME", "ylab_hw_3")
 
+# Размер страницы списка постов
+POSTS_PAGE_SIZE: int = int(os.getenv("POSTS_PAGE_SIZE", 20))
+POSTS_PAGE_MAX_SIZE: int = int(os.getenv("POSTS_PAGE_MAX_SIZE", 100))
+# Сколько постов можно запросить одним batch-запросом
+POSTS_BATCH_MAX_SIZE: int = int(os.getenv("POSTS_BATCH_MAX_SIZE", 200))
+# Сколько строк за раз выбирается из серверного курсора при выгрузке постов
+POSTS_EXPORT_CHUNK_SIZE: int = int(os.getenv("POSTS_EXPORT_CHUNK_SIZE", 1000))
+# Групповая запись постов: создания копятся до MAX_SIZE штук или MAX_DELAY
+# миллисекунд и пишутся одним INSERT
+POSTS_BATCH_WRITE_ENABLED: bool = os.getenv("POSTS_BATCH_WRITE_ENABLED", "false").lower() == "true"
+POSTS_BATCH_WRITE_MAX_SIZE: int = int(os.getenv("POSTS_BATCH_WRITE_MAX_SIZE", 100))
+POSTS_BATCH_WRITE_MAX_DELAY_IN_MS: int = int(os.getenv("POSTS_BATCH_WRITE_MAX_DELAY_IN_MS", 5))
+# Массовая загрузка постов: строк на один COPY и сколько ошибок вернуть в ответе
+POSTS_IMPORT_CHUNK_SIZE: int = int(os.getenv("POSTS_IMPORT_CHUNK_SIZE", 5000))
+POSTS_IMPORT_MAX_ERRORS: int = int(os.getenv("POSTS_IMPORT_MAX_ERRORS", 100))
+
 # Настройки Redis
 REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT: int = int(os.getenv("REDIS_PORT", 6379))
+# Один пул соединений на воркер, общий для всех кэшей
+REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS", 20))
+REDIS_POOL_TIMEOUT_IN_SECONDS: float = float(os.getenv("REDIS_POOL_TIMEOUT_IN_SECONDS", 5))
+# Должен быть больше времени блокирующего XREAD фильтра заблокированных токенов (5 с)
+REDIS_SOCKET_TIMEOUT_IN_SECONDS: float = float(
+    os.getenv("REDIS_SOCKET_TIMEOUT_IN_SECONDS", 10)
+)
+REDIS_SOCKET_CONNECT_TIMEOUT_IN_SECONDS: float = float(
+    os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT_IN_SECONDS", 2)
+)
+REDIS_HEALTH_CHECK_INTERVAL_IN_SECONDS: int = int(
+    os.getenv("REDIS_HEALTH_CHECK_INTERVAL_IN_SECONDS", 30)
+)
+# Префиксы ключей вместо отдельных логических баз Redis
+POST_CACHE_PREFIX: str = "post:"
+BLOCKED_ACCESS_TOKENS_PREFIX: str = "blocked_access_token:"
+ACTIVE_REFRESH_TOKENS_PREFIX: str = "active_refresh_tokens:"
+USER_CACHE_PREFIX: str = "user:"
+# Сколько активных сессий (refresh-токенов) может быть у пользователя;
+# при превышении вытесняются самые старые
+REFRESH_TOKENS_MAX_DEVICES: int = int(os.getenv("REFRESH_TOKENS_MAX_DEVICES", 10))
+REFRESH_TOKENS_SWEEP_INTERVAL_IN_SECONDS: int = int(
+    os.getenv("REFRESH_TOKENS_SWEEP_INTERVAL_IN_SECONDS", 60 * 60)
+)
 CACHE_EXPIRE_IN_SECONDS: int = 60 * 5  # 5 минут
 CACHE_JWT_EXPIRE_IN_SECONDS: int = JWT_EXPIRE_IN_MINUTES * 60  # 15 минут
+# Локальный уровень кэша постов в памяти каждого воркера
+LOCAL_CACHE_MAX_ENTRIES: int = int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", 1000))
+LOCAL_CACHE_MAX_BYTES: int = int(os.getenv("LOCAL_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+LOCAL_CACHE_EXPIRE_IN_SECONDS: int = int(os.getenv("LOCAL_CACHE_EXPIRE_IN_SECONDS", 30))
+CACHE_INVALIDATION_CHANNEL: str = "cache_invalidation"
+# Защита кэша постов от stampede: TTL записи укорачивается на случайную долю
+# до CACHE_EXPIRE_JITTER, пересчёт ключа между воркерами идёт под блокировкой,
+# остальные ждут значение до CACHE_LOCK_WAIT_IN_SECONDS
+CACHE_EXPIRE_JITTER: float = float(os.getenv("CACHE_EXPIRE_JITTER", 0.1))
+CACHE_LOCK_EXPIRE_IN_SECONDS: int = int(os.getenv("CACHE_LOCK_EXPIRE_IN_SECONDS", 5))
+CACHE_LOCK_WAIT_IN_SECONDS: float = float(os.getenv("CACHE_LOCK_WAIT_IN_SECONDS", 1))
+# Чем больше beta, тем раньше до истечения запись пересчитывается заранее
+CACHE_EARLY_REFRESH_BETA: float = float(os.getenv("CACHE_EARLY_REFRESH_BETA", 1.0))
+# Кэш профилей пользователей: локальный уровень и канал его инвалидаций
+USER_CACHE_EXPIRE_IN_SECONDS: int = int(os.getenv("USER_CACHE_EXPIRE_IN_SECONDS", 60 * 60))
+USER_CACHE_LOCAL_MAX_ENTRIES: int = int(os.getenv("USER_CACHE_LOCAL_MAX_ENTRIES", 10000))
+USER_CACHE_INVALIDATION_CHANNEL: str = "user_cache_invalidation"
+# Bloom-фильтр заблокированных access-токенов в памяти воркера
+BLOCKED_TOKENS_STREAM_KEY: str = "blocked_access_tokens_stream"
+BLOCKED_TOKENS_FILTER_CAPACITY: int = int(
+    os.getenv("BLOCKED_TOKENS_FILTER_CAPACITY", 100000)
+)
+BLOCKED_TOKENS_FILTER_ERROR_RATE: float = 0.001
+# Сжатие ответов: ответы меньше порога не сжимаются
+COMPRESSION_MINIMUM_SIZE: int = int(os.getenv("COMPRESSION_MINIMUM_SIZE", 500))
+COMPRESSION_GZIP_LEVEL: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", 5))
+COMPRESSION_BROTLI_QUALITY: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+# Хэш Redis с версиями таблиц для ETag списков
+TABLE_VERSIONS_KEY: str = "table_versions"
+# Cache-Control ответов с ETag: по умолчанию клиент хранит ответ,
+# но перепроверяет его через If-None-Match при каждом запросе
+HTTP_CACHE_CONTROL: str = os.getenv("HTTP_CACHE_CONTROL", "private, no-cache")
+# Просмотры постов копятся в Redis и периодически пачкой пишутся в Postgres
+POST_VIEWS_KEY: str = "post_views"
+POST_VIEWS_FLUSH_INTERVAL_IN_SECONDS: int = int(
+    os.getenv("POST_VIEWS_FLUSH_INTERVAL_IN_SECONDS", 10)
+)
+POST_VIEWS_FLUSH_BATCH_SIZE: int = 1000
 
 # Настройки Postgres
 POSTGRES_HOST: str = os.getenv("POSTGRES_HOST", "localhost")
@@ -25,7 +113,37 @@ POSTGRES_DB: str = os.getenv("POSTGRES_DB", "ylab_hw")
 POSTGRES_USER: str = os.getenv("POSTGRES_USER", "ylab_hw")
 POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD", "ylab_hw")
 
-DATABASE_URL: str = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+# Драйвер асинхронного движка: postgresql+asyncpg (по умолчанию) или любой
+# другой async-драйвер SQLAlchemy, например sqlite+aiosqlite для локальных тестов
+DATABASE_DRIVER: str = os.getenv("DATABASE_DRIVER", "postgresql+asyncpg")
+
+DATABASE_URL: str = f"{DATABASE_DRIVER}://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+
+# Реплики Postgres для чтения, полные URL через запятую
+DATABASE_REPLICA_URLS: list[str] = [
+    url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()
+]
+# Сколько секунд после записи клиент читает с основной БД (read-your-writes)
+READ_YOUR_WRITES_WINDOW_IN_SECONDS: int = int(
+    os.getenv("READ_YOUR_WRITES_WINDOW_IN_SECONDS", 5)
+)
+READ_YOUR_WRITES_COOKIE: str = "read_primary"
+
+# Пул соединений с Postgres на каждый воркер
+DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT_IN_SECONDS: float = float(os.getenv("DB_POOL_TIMEOUT_IN_SECONDS", 10))
+DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Пересоздавать соединения старше получаса, пока их не закрыл сервер или балансировщик
+DB_POOL_RECYCLE_IN_SECONDS: int = int(os.getenv("DB_POOL_RECYCLE_IN_SECONDS", 30 * 60))
+DB_ECHO: bool = os.getenv("DB_ECHO", "false").lower() == "true"
+# Замер SQL-запросов вместо echo: в лог идут запросы дольше порога
+# и случайная доля SQL_LOG_SAMPLE_RATE остальных, параметры редактируются
+SQL_STATS_ENABLED: bool = os.getenv("SQL_STATS_ENABLED", "true").lower() == "true"
+SQL_SLOW_QUERY_THRESHOLD_IN_MS: float = float(os.getenv("SQL_SLOW_QUERY_THRESHOLD_IN_MS", 200))
+SQL_LOG_SAMPLE_RATE: float = float(os.getenv("SQL_LOG_SAMPLE_RATE", 0.0))
+# Сколько различных нормализованных запросов хранить в гистограммах
+SQL_STATS_MAX_QUERIES: int = int(os.getenv("SQL_STATS_MAX_QUERIES", 500))
 
 # Корень проекта
 BASE_DIR = Path(__file__).resolve().parent.parent
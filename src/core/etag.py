@@ -0,0 +1,39 @@
+import hashlib
+from typing import Optional, Union
+
+from fastapi import Response, status
+
+from src.core import config
+
+__all__ = ("make_etag", "etag_matches", "set_cache_headers", "not_modified")
+
+
+def make_etag(*parts: Union[bytes, str, int, None]) -> str:
+    """Сильный ETag — хэш частей представления (тела ответа или версии данных)."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\x00")
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Совпадает ли ETag с одним из перечисленных в If-None-Match."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match сравнивает слабо: W/"x" совпадает с "x"
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def set_cache_headers(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = config.HTTP_CACHE_CONTROL
+
+
+def not_modified(etag: str) -> Response:
+    """Ответ 304 без тела: у клиента уже актуальное представление."""
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_cache_headers(response, etag)
+    return response
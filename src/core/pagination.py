@@ -0,0 +1,26 @@
+import base64
+import json
+
+from fastapi import HTTPException, status
+
+__all__ = ("encode_cursor", "decode_cursor")
+
+
+def encode_cursor(*values) -> str:
+    """Упакует значения ключа сортировки последней записи в непрозрачный курсор."""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """Вернет значения ключа сортировки, упакованные в курсор."""
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        # Если курсор испорчен, отдаём 400 статус
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="invalid cursor")
+    return values
@@ -1,11 +1,68 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+from fastapi import HTTPException, status
 from passlib.hash import bcrypt
 
-__all__ = ("get_hash_password", "verify_password")
+from src.core import config
+from src.core.metrics import PASSWORD_HASHING_DURATION
+
+__all__ = (
+    "get_hash_password",
+    "verify_password",
+    "start_password_pool",
+    "stop_password_pool",
+)
 
+# bcrypt занимает CPU на сотни миллисекунд, поэтому считаем его в отдельных
+# процессах: так он не держит ни event loop, ни GIL воркера
+password_pool: Optional[ProcessPoolExecutor] = None
+# Сколько задач хеширования сейчас в пуле (выполняются или ждут очереди)
+pending_tasks: int = 0
 
-def get_hash_password(password: str) -> str:
+
+def _hash_password(password: str) -> str:
     return bcrypt.hash(password)
 
 
-def verify_password(password: str, password_hash: str) -> bool:
+def _verify_password(password: str, password_hash: str) -> bool:
     return bcrypt.verify(password, password_hash)
+
+
+def start_password_pool() -> None:
+    global password_pool
+    password_pool = ProcessPoolExecutor(max_workers=config.PASSWORD_HASHING_WORKERS)
+
+
+def stop_password_pool() -> None:
+    global password_pool
+    if password_pool is not None:
+        password_pool.shutdown(cancel_futures=True)
+        password_pool = None
+
+
+async def _run_in_pool(func: Callable, *args):
+    global pending_tasks
+    max_pending = config.PASSWORD_HASHING_WORKERS + config.PASSWORD_HASHING_QUEUE_SIZE
+    if pending_tasks >= max_pending:
+        # Если очередь переполнена, сразу отдаём 503 вместо ожидания
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="too many authentication requests, try again later",
+                            headers={"Retry-After": "1"})
+    pending_tasks += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(password_pool, func, *args)
+    finally:
+        pending_tasks -= 1
+
+
+async def get_hash_password(password: str) -> str:
+    with PASSWORD_HASHING_DURATION.labels("hash").time():
+        return await _run_in_pool(_hash_password, password)
+
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    with PASSWORD_HASHING_DURATION.labels("verify").time():
+        return await _run_in_pool(_verify_password, password, password_hash)
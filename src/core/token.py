@@ -1,3 +1,6 @@
+import base64
+import hashlib
+import time
 import uuid
 from calendar import timegm
 from datetime import datetime, timedelta
@@ -8,15 +11,93 @@ from jose import JWTError, jwt
 
 from src.api.v1.schemas import UserProfile
 from src.core import config
+from src.core.lru import TTLLRUCache
 
 __all__ = ("create_tokens", "validate_token")
 
+# Уже проверенные claims по дайджесту токена, живут до exp токена
+verified_claims = TTLLRUCache(max_entries=config.JWT_CLAIMS_CACHE_MAX_ENTRIES)
+
 
 def convert_to_unix_timestamp(time: datetime) -> int:
     return timegm(time.utctimetuple())
 
 
-def create_access_token(utc_now: datetime, refresh_jti: str, user: UserProfile) -> str:
+def token_digest(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+# Компактный профиль токена: только эти claims, под короткими именами
+COMPACT_CLAIM_NAMES = {
+    "iat": "iat",
+    "exp": "exp",
+    "jti": "jti",
+    "type": "t",
+    "user_uuid": "sub",
+    "refresh_jti": "rj",
+    "version": "v",
+    "is_superuser": "su",
+}
+FULL_CLAIM_NAMES = {short_name: name for name, short_name in COMPACT_CLAIM_NAMES.items()}
+COMPACT_TOKEN_TYPES = {"access": "a", "refresh": "r"}
+FULL_TOKEN_TYPES = {short_type: name for name, short_type in COMPACT_TOKEN_TYPES.items()}
+
+
+# sub передаётся 16 байтами в base64url: 22 символа вместо 36. jti и rj
+# остаются строками — их упаковка стоила бы на каждом выпуске и проверке
+# больше, чем экономит байт. uuid.UUID не используем: он заметно медленнее
+def pack_uuid(value: str) -> str:
+    return base64.urlsafe_b64encode(bytes.fromhex(value.replace("-", ""))).rstrip(b"=").decode()
+
+
+def unpack_uuid(value: str) -> str:
+    digits = base64.urlsafe_b64decode(value + "==").hex()
+    return f"{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}"
+
+
+def compact_claims(payload: dict) -> dict:
+    compact = {
+        short_name: payload[name]
+        for name, short_name in COMPACT_CLAIM_NAMES.items() if name in payload
+    }
+    if "sub" in compact:
+        compact["sub"] = pack_uuid(compact["sub"])
+    if "t" in compact:
+        compact["t"] = COMPACT_TOKEN_TYPES[compact["t"]]
+    return compact
+
+
+def expand_claims(compact: dict) -> dict:
+    """Привести компактные claims к полным именам, как в обычном профиле."""
+    payload = {FULL_CLAIM_NAMES.get(short_name, short_name): value
+               for short_name, value in compact.items()}
+    if "user_uuid" in payload:
+        payload["user_uuid"] = unpack_uuid(payload["user_uuid"])
+    if "type" in payload:
+        payload["type"] = FULL_TOKEN_TYPES[payload["type"]]
+    return payload
+
+
+def encode_token(payload: dict) -> tuple[str, dict]:
+    """Подписать claims; в компактном профиле вернет их в том виде,
+    в каком их потом вернет validate_token."""
+    if config.JWT_COMPACT_CLAIMS:
+        compact = compact_claims(payload)
+        # То же, что expand_claims(compact), без обратной распаковки
+        payload = {name: payload[name] for name in COMPACT_CLAIM_NAMES if name in payload}
+    else:
+        compact = payload
+    token = jwt.encode(compact, key=config.JWT_SECRET_KEY,
+                       algorithm=config.JWT_ALGORITHM)
+    return token, payload
+
+
+def remember_claims(digest: bytes, payload: dict) -> None:
+    verified_claims.set(digest, payload, ttl=payload.get("exp", 0) - time.time())
+
+
+def create_access_token(utc_now: datetime, refresh_jti: str,
+                        user: UserProfile) -> tuple[str, dict]:
     user_data = user.dict()
     utc_exp = convert_to_unix_timestamp(
         utc_now + timedelta(minutes=config.JWT_EXPIRE_IN_MINUTES)
@@ -33,12 +114,11 @@ def create_access_token(utc_now: datetime, refresh_jti: str, user: UserProfile)
     }
     user_data["created_at"] = str(user.created_at)
     payload.update(user_data)
-    token = jwt.encode(payload, key=config.JWT_SECRET_KEY,
-                       algorithm=config.JWT_ALGORITHM)
-    return token
+    return encode_token(payload)
 
 
-def create_refresh_token(utc_now: datetime, jti: str, user_uuid: str) -> str:
+def create_refresh_token(utc_now: datetime, jti: str, user_uuid: str,
+                         version: int) -> tuple[str, dict]:
     utc_exp = convert_to_unix_timestamp(
         utc_now + timedelta(days=config.JWT_REFRESH_EXPIRE_IN_DAYS)
     )
@@ -48,26 +128,32 @@ def create_refresh_token(utc_now: datetime, jti: str, user_uuid: str) -> str:
         "jti": jti,
         "type": "refresh",
         "user_uuid": user_uuid,
+        "version": version,
         "nbf": utc_now,
         "exp": utc_exp,
     }
-    token = jwt.encode(payload, key=config.JWT_SECRET_KEY,
-                       algorithm=config.JWT_ALGORITHM)
-    return token
+    return encode_token(payload)
 
 
-def create_tokens(user: UserProfile) -> dict:
+def create_tokens(user: UserProfile) -> tuple[dict, dict]:
+    """Вернет токены и их claims, чтобы вызывающему не пришлось их декодировать."""
     user_uuid = str(user.uuid)
     refresh_jti = str(uuid.uuid4())
     utc_now = datetime.utcnow()
-    refresh_token = create_refresh_token(utc_now=utc_now, jti=refresh_jti,
-                                         user_uuid=user_uuid)
-    access_token = create_access_token(utc_now=utc_now, refresh_jti=refresh_jti,
-                                       user=user)
-    return {"access_token": access_token, "refresh_token": refresh_token}
+    refresh_token, refresh_payload = create_refresh_token(
+        utc_now=utc_now, jti=refresh_jti, user_uuid=user_uuid, version=user.version
+    )
+    access_token, access_payload = create_access_token(
+        utc_now=utc_now, refresh_jti=refresh_jti, user=user
+    )
+    remember_claims(token_digest(refresh_token), refresh_payload)
+    remember_claims(token_digest(access_token), access_payload)
+    tokens = {"access_token": access_token, "refresh_token": refresh_token}
+    claims = {"access_token": access_payload, "refresh_token": refresh_payload}
+    return tokens, claims
 
 
-def validate_token(token: str) -> Optional[dict]:
+def decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, key=config.JWT_SECRET_KEY,
                              algorithms=config.JWT_ALGORITHM)
@@ -75,4 +161,16 @@ def validate_token(token: str) -> Optional[dict]:
         # Если токен не прошел валидацию, отдаём 401 статус
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail="could not validate credentials")
+    if "t" in payload:
+        # Токен компактного профиля
+        payload = expand_claims(payload)
+    return payload
+
+
+def validate_token(token: str) -> Optional[dict]:
+    digest = token_digest(token)
+    if (payload := verified_claims.get(digest)) is not None:
+        return payload
+    payload = decode_token(token)
+    remember_claims(digest, payload)
     return payload
@@ -1,3 +1,6 @@
 from .cache import *
 from .db import *
 from .redis_cache import *
+from .redis_pool import *
+from .local_cache import *
+from .stampede import *
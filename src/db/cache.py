@@ -1,16 +1,20 @@
 from abc import ABC, abstractmethod
-from typing import Optional, Union
+from typing import Awaitable, Callable, Optional, Union
 
-from redis import Redis
+from redis.asyncio import Redis
 
 from src.core import config
 
 __all__ = (
     "AbstractCache",
     "ListAbstractCache",
+    "CounterAbstractCache",
     "get_cache",
     "get_access_tokens_cache",
     "get_refresh_tokens_cache",
+    "get_post_views_cache",
+    "get_user_cache",
+    "get_table_versions_cache",
 )
 
 
@@ -19,11 +23,11 @@ class AbstractCache(ABC):
         self.cache = cache_instance
 
     @abstractmethod
-    def get(self, key: str):
+    async def get(self, key: str):
         pass
 
     @abstractmethod
-    def set(
+    async def set(
         self,
         key: str,
         value: Union[bytes, str],
@@ -32,7 +36,52 @@ class AbstractCache(ABC):
         pass
 
     @abstractmethod
-    def close(self):
+    async def get_many(self, keys: list[str]) -> list:
+        """Вернет значения ключей в том же порядке, None для отсутствующих."""
+        pass
+
+    @abstractmethod
+    async def set_many(
+        self,
+        values: dict[str, Union[bytes, str]],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ):
+        pass
+
+    @abstractmethod
+    async def add(
+        self,
+        key: str,
+        value: Union[bytes, str],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ) -> bool:
+        """Сохранить значение, только если ключа ещё нет; вернет, сохранено ли."""
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str):
+        pass
+
+    async def get_or_set(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Optional[bytes]]],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ) -> Optional[bytes]:
+        """Вернет значение ключа, при промахе вычислит его через compute и сохранит.
+
+        None от compute не кэшируется. StampedeProtectedCache переопределяет
+        метод, чтобы промах одного ключа не превращался в лавину вычислений.
+        """
+        if (value := await self.get(key)) is not None:
+            return value
+        value = await compute()
+        if value is not None:
+            await self.set(key, value, expire=expire)
+        return value
+
+    @abstractmethod
+    async def close(self):
         pass
 
 
@@ -41,29 +90,80 @@ class ListAbstractCache(ABC):
         self.cache = cache_instance
 
     @abstractmethod
-    def add(self, key: str, value: Union[bytes, str]):
+    async def add(self, key: str, value: Union[bytes, str],
+                  expire_at: Optional[int] = None):
+        pass
+
+    @abstractmethod
+    async def remove(self, key: str, value: Union[bytes, str]):
+        pass
+
+    @abstractmethod
+    async def clear(self, key: str):
+        pass
+
+    @abstractmethod
+    async def find(self, key: str, value: Union[bytes, str]):
+        pass
+
+    @abstractmethod
+    async def exchange(self, key: str, old_value: Union[bytes, str],
+                       new_value: Union[bytes, str],
+                       expire_at: Optional[int] = None) -> bool:
+        """Атомарно заменить old_value на new_value, только если old_value ещё в списке."""
+        pass
+
+    @abstractmethod
+    async def revoke(self, key: str, access_jti: str,
+                     refresh_jti: Optional[str] = None,
+                     new_refresh_jti: Optional[str] = None,
+                     expire_at: Optional[int] = None) -> bool:
+        """Атомарно заблокировать access-токен и изменить сессии key.
+
+        Без refresh_jti удаляются все сессии, с ним — только эта, а с
+        new_refresh_jti она заменяется новой. Вернет False, если access-токен
+        уже заблокирован; сессии тогда не меняются.
+        """
+        pass
+
+    @abstractmethod
+    async def close(self):
+        pass
+
+
+class CounterAbstractCache(ABC):
+    def __init__(self, cache_instance: Redis):
+        self.cache = cache_instance
+
+    @abstractmethod
+    async def get(self, key: str, field: str) -> int:
+        """Вернет значение счетчика, 0 для отсутствующего."""
         pass
 
     @abstractmethod
-    def remove(self, key: str, value: Union[bytes, str]):
+    async def incr(self, key: str, field: str, amount: int = 1):
         pass
 
     @abstractmethod
-    def clear(self, key: str):
+    async def incr_many(self, key: str, amounts: dict[str, int]):
         pass
 
     @abstractmethod
-    def find(self, key: str, value: Union[bytes, str]):
+    async def pop_all(self, key: str):
         pass
 
     @abstractmethod
-    def close(self):
+    async def close(self):
         pass
 
 
 cache: Optional[AbstractCache] = None
 blocked_access_tokens_cache: Optional[AbstractCache] = None
 active_refresh_tokens_cache: Optional[ListAbstractCache] = None
+post_views_cache: Optional[CounterAbstractCache] = None
+user_cache: Optional[AbstractCache] = None
+# Версии таблиц для ETag списков, растут при каждом изменении таблицы
+table_versions_cache: Optional[CounterAbstractCache] = None
 
 
 # Функция понадобится при внедрении зависимостей
@@ -77,3 +177,15 @@ def get_access_tokens_cache() -> AbstractCache:
 
 def get_refresh_tokens_cache() -> ListAbstractCache:
     return active_refresh_tokens_cache
+
+
+def get_post_views_cache() -> CounterAbstractCache:
+    return post_views_cache
+
+
+def get_user_cache() -> AbstractCache:
+    return user_cache
+
+
+def get_table_versions_cache() -> CounterAbstractCache:
+    return table_versions_cache
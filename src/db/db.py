@@ -1,13 +1,67 @@
-from sqlmodel import Session, create_engine
+import itertools
+from typing import AsyncIterator
+
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.core import config
+from src.db.instrumentation import InstrumentedQueuePool, instrument_engine
+
+__all__ = ("async_session", "get_session", "get_read_session", "get_primary_read_session")
+
+
+def create_engine(url: str) -> AsyncEngine:
+    engine = create_async_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        echo=config.DB_ECHO,
+        future=True,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT_IN_SECONDS,
+        pool_pre_ping=config.DB_POOL_PRE_PING,
+        pool_recycle=config.DB_POOL_RECYCLE_IN_SECONDS,
+    )
+    if config.SQL_STATS_ENABLED:
+        # События курсора есть только у синхронного движка под AsyncEngine
+        instrument_engine(engine.sync_engine)
+    return engine
+
 
-__all__ = ("get_session",)
+engine = create_engine(config.DATABASE_URL)
+# Реплики для чтения, выбираются по кругу
+replica_engines = [create_engine(url) for url in config.DATABASE_REPLICA_URLS]
+replica_engines_cycle = itertools.cycle(replica_engines)
 
+# expire_on_commit=False: после commit атрибуты не должны подгружаться лениво,
+# иначе обращение к ним вне await упадёт
+async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
-engine = create_engine(config.DATABASE_URL, echo=True)
+
+async def get_session(response: Response) -> AsyncIterator[AsyncSession]:
+    """Сессия основной БД на один запрос: для записи и чтения после неё."""
+    if replica_engines:
+        # Пока реплики догоняют запись, клиент читает с основной БД
+        response.set_cookie(key=config.READ_YOUR_WRITES_COOKIE, value="1",
+                            max_age=config.READ_YOUR_WRITES_WINDOW_IN_SECONDS,
+                            httponly=True, samesite="lax")
+    async with async_session() as session:
+        yield session
+
+
+async def get_read_session(request: Request) -> AsyncIterator[AsyncSession]:
+    """Сессия на один запрос только для чтения: реплика, если она настроена."""
+    bind = engine
+    if replica_engines and config.READ_YOUR_WRITES_COOKIE not in request.cookies:
+        bind = next(replica_engines_cycle)
+    async with async_session(bind=bind) as session:
+        yield session
 
 
-def get_session():
-    with Session(engine) as session:
+async def get_primary_read_session() -> AsyncIterator[AsyncSession]:
+    """Сессия основной БД на один запрос только для чтения: когда ответ
+    помечается версией данных из Redis, отстающая реплика не годится."""
+    async with async_session() as session:
         yield session
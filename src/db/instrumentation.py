@@ -0,0 +1,248 @@
+import logging
+import math
+import random
+import re
+import time
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Optional, Union
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from src.core import config
+from src.core.metrics import (CACHE_OPERATION_DURATION, CACHE_OPERATIONS,
+                              DB_POOL_CHECKOUT_DURATION)
+from src.db import AbstractCache
+
+__all__ = (
+    "QueryStats",
+    "query_stats",
+    "instrument_engine",
+    "InstrumentedQueuePool",
+    "InstrumentedCache",
+)
+
+logger = logging.getLogger(__name__)
+
+# Верхние границы корзин гистограммы задержек, мс
+LATENCY_BUCKETS_IN_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, math.inf)
+# Сюда складываются запросы сверх лимита различных запросов
+OTHER_QUERIES = "<other>"
+
+PLACEHOLDER_RE = re.compile(r"\$\d+|%\(\w+\)s|%s|\?")
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+# Многострочный VALUES и длинные IN: (?, ?), (?, ?), ... -> (?, ?), ...
+REPEATED_GROUP_RE = re.compile(r"(\([?, ]+\))(?:, \1)+")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+# Текст запроса SQLAlchemy берёт из кэша компиляции, поэтому различных строк немного
+@lru_cache(maxsize=1024)
+def normalize_statement(statement: str) -> str:
+    """Привести запрос к виду без значений, чтобы одинаковые запросы
+    с разными параметрами попадали в одну гистограмму."""
+    statement = WHITESPACE_RE.sub(" ", statement).strip()
+    statement = PLACEHOLDER_RE.sub("?", statement)
+    statement = LITERAL_RE.sub("?", statement)
+    return REPEATED_GROUP_RE.sub(r"\1, ...", statement)
+
+
+def redact_parameters(parameters: Any, executemany: bool) -> str:
+    """Вместо значений параметров — только их типы: значения могут быть
+    паролями, токенами или персональными данными."""
+    if executemany:
+        return f"<{len(parameters)} parameter sets>"
+    if isinstance(parameters, dict):
+        return repr({name: type(value).__name__ for name, value in parameters.items()})
+    if isinstance(parameters, (list, tuple)):
+        return repr(tuple(type(value).__name__ for value in parameters))
+    return "<redacted>"
+
+
+class QueryStats:
+    """Гистограммы задержек по нормализованным запросам в памяти воркера."""
+
+    def __init__(self, max_queries: int = config.SQL_STATS_MAX_QUERIES):
+        self.max_queries = max_queries
+        self.queries: dict[str, dict] = {}
+
+    def observe(self, statement: str, duration_in_ms: float) -> None:
+        if statement not in self.queries and len(self.queries) >= self.max_queries:
+            statement = OTHER_QUERIES
+        query = self.queries.get(statement)
+        if query is None:
+            query = self.queries[statement] = {
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "buckets": [0] * len(LATENCY_BUCKETS_IN_MS),
+            }
+        query["count"] += 1
+        query["total_ms"] += duration_in_ms
+        query["max_ms"] = max(query["max_ms"], duration_in_ms)
+        for index, bound in enumerate(LATENCY_BUCKETS_IN_MS):
+            if duration_in_ms <= bound:
+                query["buckets"][index] += 1
+                break
+
+    def stats(self, limit: int = 20) -> list[dict]:
+        """Самые дорогие по суммарному времени запросы."""
+        top = sorted(self.queries.items(), key=lambda item: item[1]["total_ms"],
+                     reverse=True)[:limit]
+        return [
+            {
+                "statement": statement,
+                "count": query["count"],
+                "total_ms": round(query["total_ms"], 3),
+                "mean_ms": round(query["total_ms"] / query["count"], 3),
+                "max_ms": round(query["max_ms"], 3),
+                "buckets": {
+                    f"le_{bound}": count
+                    for bound, count in zip(LATENCY_BUCKETS_IN_MS, query["buckets"])
+                },
+            }
+            for statement, query in top
+        ]
+
+    def reset(self) -> None:
+        self.queries.clear()
+
+
+query_stats = QueryStats()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Повесить замер времени запросов на синхронный движок (для async — engine.sync_engine).
+
+    Запрос пишется в лог, если он дольше SQL_SLOW_QUERY_THRESHOLD_IN_MS
+    или попал в случайную выборку SQL_LOG_SAMPLE_RATE; параметры редактируются.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration_in_ms = (time.perf_counter() - conn.info["query_started"].pop()) * 1000
+        query_stats.observe(normalize_statement(statement), duration_in_ms)
+        is_slow = duration_in_ms >= config.SQL_SLOW_QUERY_THRESHOLD_IN_MS
+        if is_slow or random.random() < config.SQL_LOG_SAMPLE_RATE:
+            logger.log(
+                logging.WARNING if is_slow else logging.INFO,
+                "%s query %.1f ms: %s parameters=%s",
+                "slow" if is_slow else "sampled",
+                duration_in_ms,
+                WHITESPACE_RE.sub(" ", statement).strip(),
+                redact_parameters(parameters, executemany),
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # Упавший запрос не дойдёт до after_cursor_execute
+        if context.connection is not None and context.connection.info.get("query_started"):
+            context.connection.info["query_started"].pop()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений Postgres, замеряющий ожидание свободного соединения."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        connection = super()._do_get()
+        DB_POOL_CHECKOUT_DURATION.observe(time.perf_counter() - started)
+        return connection
+
+
+def expire_option(expire: Optional[int]) -> dict:
+    # Без явного expire действует TTL по умолчанию обёрнутого кэша
+    return {} if expire is None else {"expire": expire}
+
+
+class InstrumentedCache(AbstractCache):
+    """Обёртка над любым AbstractCache: попадания, промахи и время операций
+    в метриках Prometheus с меткой name."""
+
+    cache: AbstractCache
+
+    def __init__(self, cache_instance: AbstractCache, name: str):
+        super().__init__(cache_instance)
+        self.name = name
+        self.durations = {
+            operation: CACHE_OPERATION_DURATION.labels(name, operation)
+            for operation in ("get", "set", "get_many", "set_many", "add",
+                              "delete", "get_or_set")
+        }
+        self.hits = CACHE_OPERATIONS.labels(name, "get", "hit")
+        self.misses = CACHE_OPERATIONS.labels(name, "get", "miss")
+
+    async def timed(self, operation: str, call: Awaitable):
+        with self.durations[operation].time():
+            return await call
+
+    async def get(self, key: str) -> Optional[bytes]:
+        value = await self.timed("get", self.cache.get(key))
+        (self.hits if value is not None else self.misses).inc()
+        return value
+
+    async def set(
+        self,
+        key: str,
+        value: Union[bytes, str],
+        expire: Optional[int] = None,
+    ) -> None:
+        await self.timed("set", self.cache.set(key, value, **expire_option(expire)))
+
+    async def get_many(self, keys: list[str]) -> list[Optional[bytes]]:
+        values = await self.timed("get_many", self.cache.get_many(keys))
+        hits = sum(value is not None for value in values)
+        self.hits.inc(hits)
+        self.misses.inc(len(values) - hits)
+        return values
+
+    async def set_many(
+        self,
+        values: dict[str, Union[bytes, str]],
+        expire: Optional[int] = None,
+    ) -> None:
+        await self.timed("set_many", self.cache.set_many(values, **expire_option(expire)))
+
+    async def add(
+        self,
+        key: str,
+        value: Union[bytes, str],
+        expire: Optional[int] = None,
+    ) -> bool:
+        return await self.timed("add", self.cache.add(key, value, **expire_option(expire)))
+
+    async def delete(self, key: str) -> None:
+        await self.timed("delete", self.cache.delete(key))
+
+    async def get_or_set(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Optional[bytes]]],
+        expire: Optional[int] = None,
+    ) -> Optional[bytes]:
+        is_computed = False
+
+        async def compute_miss() -> Optional[bytes]:
+            nonlocal is_computed
+            is_computed = True
+            return await compute()
+
+        # Защиту от stampede оставляем обёрнутому кэшу. Промах — только вызов,
+        # который сам вычислил значение: дождавшиеся чужого вычисления
+        # в БД не ходили и считаются попаданием
+        value = await self.timed(
+            "get_or_set", self.cache.get_or_set(key, compute_miss, **expire_option(expire))
+        )
+        (self.misses if is_computed else self.hits).inc()
+        return value
+
+    async def close(self) -> None:
+        await self.cache.close()
+
+    def stats(self) -> dict:
+        return self.cache.stats() if hasattr(self.cache, "stats") else {}
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+from typing import NoReturn, Optional, Union
+
+from src.core import config
+from src.core.lru import TTLLRUCache
+from src.db import AbstractCache, CacheRedis
+
+__all__ = ("LocalCache", "TwoTierCache")
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCache(AbstractCache):
+    """Кэш в памяти воркера поверх TTLLRUCache."""
+
+    cache: TTLLRUCache
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.cache.get(key)
+
+    async def set(
+        self,
+        key: str,
+        value: Union[bytes, str],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ) -> None:
+        self.cache.set(key, value, ttl=expire, size=len(key) + len(value))
+
+    async def get_many(self, keys: list[str]) -> list[Optional[bytes]]:
+        return [self.cache.get(key) for key in keys]
+
+    async def set_many(
+        self,
+        values: dict[str, Union[bytes, str]],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ) -> None:
+        for key, value in values.items():
+            await self.set(key, value, expire=expire)
+
+    async def add(
+        self,
+        key: str,
+        value: Union[bytes, str],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ) -> bool:
+        if self.cache.get(key) is not None:
+            return False
+        await self.set(key, value, expire=expire)
+        return True
+
+    async def delete(self, key: str) -> None:
+        self.cache.delete(key)
+
+    async def close(self) -> None:
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+class TwoTierCache(AbstractCache):
+    """Локальный кэш воркера перед общим CacheRedis.
+
+    Удаление ключа рассылается через Redis pub/sub, и каждый воркер
+    выбрасывает его из своего локального уровня.
+    """
+
+    cache: CacheRedis
+
+    def __init__(
+        self,
+        cache_instance: CacheRedis,
+        local_cache: LocalCache,
+        channel: str,
+        local_expire: int = config.LOCAL_CACHE_EXPIRE_IN_SECONDS,
+    ):
+        super().__init__(cache_instance)
+        self.local_cache = local_cache
+        self.channel = channel
+        self.local_expire = local_expire
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        if (value := await self.local_cache.get(key)) is not None:
+            return value
+        value = await self.cache.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        await self.local_cache.set(key, value, expire=self.local_expire)
+        return value
+
+    async def set(
+        self,
+        key: str,
+        value: Union[bytes, str],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ) -> None:
+        # False — Redis отказался от записи (VersionedCacheRedis хранит более
+        # новую версию): устаревшее значение не должно попасть и в локальный уровень
+        if await self.cache.set(key, value, expire=expire) is False:
+            return
+        await self.local_cache.set(key, value, expire=min(expire, self.local_expire))
+
+    async def get_many(self, keys: list[str]) -> list[Optional[bytes]]:
+        values = await self.local_cache.get_many(keys)
+        missing = [index for index, value in enumerate(values) if value is None]
+        if not missing:
+            return values
+        remote_values = await self.cache.get_many([keys[index] for index in missing])
+        found = {}
+        for index, value in zip(missing, remote_values):
+            values[index] = value
+            if value is not None:
+                found[keys[index]] = value
+        self.hits += len(found)
+        self.misses += len(missing) - len(found)
+        await self.local_cache.set_many(found, expire=self.local_expire)
+        return values
+
+    async def set_many(
+        self,
+        values: dict[str, Union[bytes, str]],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ) -> None:
+        is_set = await self.cache.set_many(values, expire=expire)
+        if is_set is not None:
+            values = {key: value for (key, value), is_stored in zip(values.items(), is_set)
+                      if is_stored}
+        await self.local_cache.set_many(values, expire=min(expire, self.local_expire))
+
+    async def add(
+        self,
+        key: str,
+        value: Union[bytes, str],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ) -> bool:
+        if not await self.cache.add(key, value, expire=expire):
+            return False
+        await self.local_cache.set(key, value, expire=min(expire, self.local_expire))
+        return True
+
+    async def delete(self, key: str) -> None:
+        await self.cache.delete(key)
+        await self.local_cache.delete(key)
+        await self.cache.publish(self.channel, key)
+
+    async def listen(self) -> NoReturn:
+        """Слушать инвалидации других воркеров; запускается фоновой задачей."""
+        while True:
+            pubsub = self.cache.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                # Пока подписки не было, инвалидации могли потеряться
+                await self.local_cache.close()
+                while True:
+                    # Ждём с таймаутом меньше socket_timeout пула, иначе
+                    # простой канала выглядел бы как обрыв соединения
+                    message = await pubsub.get_message(ignore_subscribe_messages=True,
+                                                       timeout=1.0)
+                    if message is not None:
+                        await self.local_cache.delete(message["data"].decode())
+            except Exception:
+                logger.exception("cache invalidation listener failed")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.reset()
+
+    async def close(self) -> None:
+        await self.local_cache.close()
+        await self.cache.close()
+
+    def stats(self) -> dict:
+        return {
+            "local": self.local_cache.stats(),
+            "redis": {"hits": self.hits, "misses": self.misses},
+        }
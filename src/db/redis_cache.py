@@ -1,49 +1,456 @@
+import asyncio
+import logging
+import time
 from typing import NoReturn, Optional, Union
 
+from redis.asyncio import Redis
+from redis.asyncio.client import PubSub
+
 from src.core import config
-from src.db import AbstractCache, ListAbstractCache
+from src.core.bloom import BloomFilter
+from src.db import AbstractCache, CounterAbstractCache, ListAbstractCache
 
 __all__ = ("CacheRedis",)
 
+logger = logging.getLogger(__name__)
+
 
 class CacheRedis(AbstractCache):
-    def get(self, key: str) -> Optional[dict]:
-        return self.cache.get(name=key)
+    def __init__(self, cache_instance: Redis, prefix: str = ""):
+        super().__init__(cache_instance)
+        # Кэши делят один Redis и один пул, поэтому разделяются префиксом ключей
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[dict]:
+        return await self.cache.get(name=self.prefix + key)
 
-    def set(
+    async def set(
         self,
         key: str,
         value: Union[bytes, str],
         expire: int = config.CACHE_EXPIRE_IN_SECONDS,
     ):
-        self.cache.set(name=key, value=value, ex=expire)
+        await self.cache.set(name=self.prefix + key, value=value, ex=expire)
+
+    async def get_many(self, keys: list[str]) -> list[Optional[bytes]]:
+        if not keys:
+            return []
+        return await self.cache.mget([self.prefix + key for key in keys])
+
+    async def set_many(
+        self,
+        values: dict[str, Union[bytes, str]],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ) -> None:
+        async with self.cache.pipeline(transaction=False) as pipe:
+            for key, value in values.items():
+                pipe.set(name=self.prefix + key, value=value, ex=expire)
+            await pipe.execute()
+
+    async def add(
+        self,
+        key: str,
+        value: Union[bytes, str],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ) -> bool:
+        return bool(await self.cache.set(name=self.prefix + key, value=value,
+                                         ex=expire, nx=True))
+
+    async def delete(self, key: str) -> None:
+        await self.cache.delete(self.prefix + key)
+
+    async def publish(self, channel: str, message: Union[bytes, str]) -> None:
+        await self.cache.publish(channel, message)
 
-    def close(self) -> NoReturn:
-        self.cache.close()
+    def pubsub(self) -> PubSub:
+        return self.cache.pubsub(ignore_subscribe_messages=True)
+
+    async def close(self) -> None:
+        await self.cache.close()
 
 
 class AccessTokenCacheRedis(CacheRedis):
-    def set(
+    # Стрим, в который пишется каждая блокировка, если кэш его ведёт
+    stream_key: Optional[str] = None
+    capacity: int = 0
+
+    def remember(self, key: str) -> None:
+        """Учесть блокировку, сделанную в обход set и add (в скрипте другого кэша)."""
+
+    async def set(
+        self,
+        key: str,
+        value: Union[bytes, str],
+        expire: int = config.CACHE_JWT_EXPIRE_IN_SECONDS,
+    ) -> None:
+        await self.cache.set(name=self.prefix + key, value=value, ex=expire)
+
+    async def add(
+        self,
+        key: str,
+        value: Union[bytes, str],
+        expire: int = config.CACHE_JWT_EXPIRE_IN_SECONDS,
+    ) -> bool:
+        return await super().add(key=key, value=value, expire=expire)
+
+
+# Запись с полем version не перезаписывает в Redis запись более новой версии
+SET_IF_NEWER_SCRIPT = """
+local old = redis.call('GET', KEYS[1])
+if old and cjson.decode(old)['version'] > cjson.decode(ARGV[1])['version'] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+
+
+class VersionedCacheRedis(CacheRedis):
+    """Кэш JSON-записей с полем version.
+
+    Запись, прочитанная из БД до обновления, не затрёт в Redis уже
+    записанную новую версию, даже если придёт позже неё.
+    """
+
+    def __init__(self, cache_instance: Redis, prefix: str = ""):
+        super().__init__(cache_instance, prefix=prefix)
+        self.set_script = self.cache.register_script(SET_IF_NEWER_SCRIPT)
+
+    async def set(
+        self,
+        key: str,
+        value: Union[bytes, str],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ) -> bool:
+        """Вернет False, если в Redis уже лежит более новая версия."""
+        return bool(await self.set_script(keys=[self.prefix + key], args=[value, expire]))
+
+    async def set_many(
+        self,
+        values: dict[str, Union[bytes, str]],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ) -> list[bool]:
+        """Вернет по флагу записи на каждый ключ, в порядке values."""
+        async with self.cache.pipeline(transaction=False) as pipe:
+            for key, value in values.items():
+                await self.set_script(keys=[self.prefix + key], args=[value, expire],
+                                      client=pipe)
+            return [bool(is_set) for is_set in await pipe.execute()]
+
+
+# SET NX и запись в стрим блокировок одним атомарным вызовом
+BLOCK_TOKEN_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2]) then
+    redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[3], '*', 'jti', ARGV[4])
+    return 1
+end
+return 0
+"""
+
+# Реестр refresh-токенов пользователя — sorted set jti -> время истечения.
+# Общий пролог скриптов: выбросить истекшие токены
+TRIM_REFRESH_TOKENS = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+"""
+
+# Зарегистрировать токен, вытеснить самые старые сессии сверх лимита
+# устройств и продлить TTL ключа до истечения самого позднего токена
+ADD_REFRESH_TOKEN = """
+local function add_token(jti, expire_at, max_devices)
+    redis.call('ZADD', KEYS[1], expire_at, jti)
+    local extra = redis.call('ZCARD', KEYS[1]) - max_devices
+    if extra > 0 then
+        redis.call('ZPOPMIN', KEYS[1], extra)
+    end
+    local last = redis.call('ZRANGE', KEYS[1], -1, -1, 'WITHSCORES')
+    if last[2] then
+        redis.call('EXPIREAT', KEYS[1], last[2])
+    end
+end
+"""
+
+# ARGV: now, jti, expire_at, max_devices
+ADD_REFRESH_TOKEN_SCRIPT = TRIM_REFRESH_TOKENS + ADD_REFRESH_TOKEN + """
+add_token(ARGV[2], ARGV[3], tonumber(ARGV[4]))
+return 1
+"""
+
+# ARGV: now, jti
+FIND_REFRESH_TOKEN_SCRIPT = TRIM_REFRESH_TOKENS + """
+if redis.call('ZSCORE', KEYS[1], ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+# Новый refresh-токен регистрируется, только если старый ещё активен:
+# иначе параллельный logout_all мог бы не удалить только что выданный токен.
+# Старый токен удаляется, чтобы лимит устройств считал сессии, а не обмены.
+# ARGV: now, old_jti, new_jti, expire_at, max_devices
+EXCHANGE_REFRESH_TOKEN_SCRIPT = TRIM_REFRESH_TOKENS + ADD_REFRESH_TOKEN + """
+if redis.call('ZREM', KEYS[1], ARGV[2]) == 1 then
+    add_token(ARGV[3], ARGV[4], tonumber(ARGV[5]))
+    return 1
+end
+return 0
+"""
+
+# Блокировка access-токена и изменение сессий пользователя одним вызовом:
+# выход не может заблокировать access-токен и оставить живым его refresh-токен.
+# Если access-токен уже заблокирован, сессии не меняются.
+# KEYS: сессии пользователя, блокировка, [стрим блокировок]
+# ARGV: now, access_jti, block_expire, stream_maxlen, refresh_jti, new_refresh_jti,
+#       expire_at, max_devices; пустой refresh_jti — удалить все сессии
+REVOKE_TOKENS_SCRIPT = TRIM_REFRESH_TOKENS + ADD_REFRESH_TOKEN + """
+if not redis.call('SET', KEYS[2], 'block', 'NX', 'EX', ARGV[3]) then
+    return 0
+end
+if KEYS[3] then
+    redis.call('XADD', KEYS[3], 'MAXLEN', '~', ARGV[4], '*', 'jti', ARGV[2])
+end
+if ARGV[5] == '' then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+redis.call('ZREM', KEYS[1], ARGV[5])
+if ARGV[6] ~= '' then
+    add_token(ARGV[6], ARGV[7], tonumber(ARGV[8]))
+end
+return 1
+"""
+
+
+class BloomAccessTokenCacheRedis(AccessTokenCacheRedis):
+    """Заблокированные access-токены с Bloom-фильтром воркера перед Redis.
+
+    В Redis идут только вероятные попадания фильтра. Каждая блокировка
+    пишется в стрим, из которого все воркеры пополняют свои фильтры;
+    раз в CACHE_JWT_EXPIRE_IN_SECONDS фильтр пересобирается по SCAN, чтобы
+    из него ушли истекшие токены.
+    """
+
+    def __init__(self, cache_instance: Redis, stream_key: str, prefix: str = "",
+                 capacity: int = config.BLOCKED_TOKENS_FILTER_CAPACITY,
+                 error_rate: float = config.BLOCKED_TOKENS_FILTER_ERROR_RATE):
+        super().__init__(cache_instance, prefix=prefix)
+        self.stream_key = stream_key
+        self.capacity = capacity
+        self.error_rate = error_rate
+        # Пока фильтр не собран (или синхронизация сломалась), ходим в Redis
+        self.filter: Optional[BloomFilter] = None
+        self.last_stream_id = "0-0"
+        self.skipped = 0
+        self.lookups = 0
+        self.add_script = self.cache.register_script(BLOCK_TOKEN_SCRIPT)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        if self.filter is not None and key not in self.filter:
+            self.skipped += 1
+            return None
+        self.lookups += 1
+        return await super().get(key)
+
+    async def set(
         self,
         key: str,
         value: Union[bytes, str],
         expire: int = config.CACHE_JWT_EXPIRE_IN_SECONDS,
     ) -> None:
-        self.cache.set(name=key, value=value, ex=expire)
+        async with self.cache.pipeline(transaction=True) as pipe:
+            pipe.set(name=self.prefix + key, value=value, ex=expire)
+            pipe.xadd(self.stream_key, {"jti": key},
+                      maxlen=self.capacity, approximate=True)
+            await pipe.execute()
+        if self.filter is not None:
+            self.filter.add(key)
+
+    async def add(
+        self,
+        key: str,
+        value: Union[bytes, str],
+        expire: int = config.CACHE_JWT_EXPIRE_IN_SECONDS,
+    ) -> bool:
+        is_added = await self.add_script(
+            keys=[self.prefix + key, self.stream_key],
+            args=[value, expire, self.capacity, key],
+        )
+        if is_added:
+            self.remember(key)
+        return bool(is_added)
+
+    def remember(self, key: str) -> None:
+        if self.filter is not None:
+            self.filter.add(key)
+
+    async def rebuild(self) -> None:
+        """Собрать фильтр заново по ключам, которые ещё живут в Redis."""
+        # Запоминаем позицию стрима до SCAN: всё, что заблокируют во время
+        # обхода, listen дочитает из стрима
+        last_entries = await self.cache.xrevrange(self.stream_key, count=1)
+        last_stream_id = last_entries[0][0] if last_entries else "0-0"
+        bloom_filter = BloomFilter(capacity=self.capacity, error_rate=self.error_rate)
+        async for key in self.cache.scan_iter(match=f"{self.prefix}*", count=1000):
+            bloom_filter.add(key.decode()[len(self.prefix):])
+        self.filter = bloom_filter
+        self.last_stream_id = last_stream_id
+
+    async def listen(self) -> NoReturn:
+        """Держать фильтр в актуальном состоянии; запускается фоновой задачей.
+
+        Пересборка и чтение стрима идут в одной задаче, чтобы позиция
+        в стриме не гонялась между ними.
+        """
+        rebuild_at = 0.0
+        while True:
+            try:
+                if time.monotonic() >= rebuild_at:
+                    await self.rebuild()
+                    rebuild_at = time.monotonic() + config.CACHE_JWT_EXPIRE_IN_SECONDS
+                block = max(1, int((rebuild_at - time.monotonic()) * 1000))
+                response = await self.cache.xread(
+                    {self.stream_key: self.last_stream_id}, block=min(block, 5000)
+                )
+                for _, entries in response:
+                    for entry_id, fields in entries:
+                        self.filter.add(fields[b"jti"].decode())
+                        self.last_stream_id = entry_id
+            except Exception:
+                # Без синхронизации фильтр может пропустить блокировку
+                # с другого воркера, поэтому до пересборки ходим в Redis
+                logger.exception("blocked tokens filter sync failed")
+                self.filter = None
+                rebuild_at = 0.0
+                await asyncio.sleep(1)
+
+    def stats(self) -> dict:
+        return {
+            "filter_items": self.filter.count if self.filter is not None else None,
+            "skipped": self.skipped,
+            "lookups": self.lookups,
+        }
 
 
 class RefreshTokenCacheRedis(ListAbstractCache):
-    def add(self, key: str, value: str) -> None:
-        self.cache.sadd(key, value)
+    """Активные refresh-токены пользователей с истечением и лимитом устройств."""
+
+    def __init__(self, cache_instance: Redis, prefix: str = "",
+                 max_devices: int = config.REFRESH_TOKENS_MAX_DEVICES,
+                 blocked_tokens_cache: Optional[AccessTokenCacheRedis] = None):
+        super().__init__(cache_instance)
+        self.prefix = prefix
+        self.max_devices = max_devices
+        # Блокировки access-токенов для revoke; кэши делят один Redis
+        self.blocked_tokens_cache = blocked_tokens_cache
+        self.add_script = self.cache.register_script(ADD_REFRESH_TOKEN_SCRIPT)
+        self.find_script = self.cache.register_script(FIND_REFRESH_TOKEN_SCRIPT)
+        self.exchange_script = self.cache.register_script(EXCHANGE_REFRESH_TOKEN_SCRIPT)
+        self.revoke_script = self.cache.register_script(REVOKE_TOKENS_SCRIPT)
+        self.last_sweep: dict = {}
+
+    @staticmethod
+    def default_expire_at() -> int:
+        return int(time.time()) + config.JWT_REFRESH_EXPIRE_IN_DAYS * 24 * 60 * 60
+
+    async def add(self, key: str, value: str,
+                  expire_at: Optional[int] = None) -> None:
+        await self.add_script(
+            keys=[self.prefix + key],
+            args=[int(time.time()), value, expire_at or self.default_expire_at(),
+                  self.max_devices],
+        )
+
+    async def remove(self, key: str, value: Union[bytes, str]) -> None:
+        await self.cache.zrem(self.prefix + key, value)
+
+    async def clear(self, key: str) -> None:
+        await self.cache.delete(self.prefix + key)
+
+    async def find(self, key: str, value: Union[bytes, str]) -> bool:
+        return bool(await self.find_script(keys=[self.prefix + key],
+                                           args=[int(time.time()), value]))
+
+    async def exchange(self, key: str, old_value: Union[bytes, str],
+                       new_value: Union[bytes, str],
+                       expire_at: Optional[int] = None) -> bool:
+        return bool(await self.exchange_script(
+            keys=[self.prefix + key],
+            args=[int(time.time()), old_value, new_value,
+                  expire_at or self.default_expire_at(), self.max_devices],
+        ))
+
+    async def revoke(self, key: str, access_jti: str,
+                     refresh_jti: Optional[str] = None,
+                     new_refresh_jti: Optional[str] = None,
+                     expire_at: Optional[int] = None) -> bool:
+        blocked_tokens_cache = self.blocked_tokens_cache
+        keys = [self.prefix + key, blocked_tokens_cache.prefix + access_jti]
+        if blocked_tokens_cache.stream_key:
+            keys.append(blocked_tokens_cache.stream_key)
+        is_revoked = await self.revoke_script(
+            keys=keys,
+            args=[int(time.time()), access_jti, config.CACHE_JWT_EXPIRE_IN_SECONDS,
+                  blocked_tokens_cache.capacity, refresh_jti or "", new_refresh_jti or "",
+                  expire_at or self.default_expire_at(), self.max_devices],
+        )
+        if is_revoked:
+            blocked_tokens_cache.remember(access_jti)
+        return bool(is_revoked)
+
+    async def sweep(self) -> None:
+        """Выбросить истекшие токены у всех пользователей и собрать статистику памяти."""
+        now = int(time.time())
+        stats = {"keys": 0, "tokens": 0, "removed": 0, "memory_bytes": 0}
+        keys = []
+        async for key in self.cache.scan_iter(match=f"{self.prefix}*", count=1000):
+            keys.append(key)
+            if len(keys) >= 1000:
+                await self._sweep_keys(keys, now, stats)
+                keys = []
+        if keys:
+            await self._sweep_keys(keys, now, stats)
+        self.last_sweep = stats
+
+    async def _sweep_keys(self, keys: list, now: int, stats: dict) -> None:
+        async with self.cache.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.zremrangebyscore(key, "-inf", now)
+                pipe.zcard(key)
+                pipe.memory_usage(key)
+            results = await pipe.execute()
+        for removed, tokens, memory in zip(*[iter(results)] * 3):
+            stats["removed"] += removed
+            if tokens:
+                stats["keys"] += 1
+                stats["tokens"] += tokens
+                stats["memory_bytes"] += memory or 0
+
+    def stats(self) -> dict:
+        return self.last_sweep
+
+    async def close(self) -> None:
+        await self.cache.close()
+
+
+class CounterCacheRedis(CounterAbstractCache):
+    async def get(self, key: str, field: str) -> int:
+        return int(await self.cache.hget(key, field) or 0)
 
-    def remove(self, key: str, value: Union[bytes, str]) -> None:
-        self.cache.srem(key, value)
+    async def incr(self, key: str, field: str, amount: int = 1) -> None:
+        await self.cache.hincrby(key, field, amount)
 
-    def clear(self, key: str) -> None:
-        self.cache.delete(key)
+    async def incr_many(self, key: str, amounts: dict[str, int]) -> None:
+        async with self.cache.pipeline(transaction=False) as pipe:
+            for field, amount in amounts.items():
+                pipe.hincrby(key, field, amount)
+            await pipe.execute()
 
-    def find(self, key: str, value: Union[bytes, str]) -> bool:
-        return self.cache.sismember(name=key, value=value)
+    async def pop_all(self, key: str) -> dict[str, int]:
+        """Атомарно забрать все накопленные счетчики и обнулить их."""
+        async with self.cache.pipeline(transaction=True) as pipe:
+            pipe.hgetall(key)
+            pipe.delete(key)
+            counters, _ = await pipe.execute()
+        return {field.decode(): int(amount) for field, amount in counters.items()}
 
-    def close(self) -> NoReturn:
-        self.cache.close()
+    async def close(self) -> None:
+        await self.cache.close()
@@ -0,0 +1,63 @@
+import time
+from typing import Optional
+
+from redis.asyncio import BlockingConnectionPool, Redis
+
+from src.core import config
+
+__all__ = ("InstrumentedConnectionPool", "create_redis_pool", "create_redis_client")
+
+
+class InstrumentedConnectionPool(BlockingConnectionPool):
+    """Общий пул соединений Redis со счетчиками ожидания и занятых соединений."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.in_use = 0
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    async def get_connection(self, command_name, *keys, **options):
+        started_at = time.perf_counter()
+        connection = await super().get_connection(command_name, *keys, **options)
+        waited = time.perf_counter() - started_at
+        self.checkouts += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        self.in_use += 1
+        return connection
+
+    async def release(self, connection) -> None:
+        self.in_use -= 1
+        await super().release(connection)
+
+    def stats(self) -> dict:
+        return {
+            "max_connections": self.max_connections,
+            "in_use": self.in_use,
+            "checkouts": self.checkouts,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+        }
+
+
+redis_pool: Optional[InstrumentedConnectionPool] = None
+
+
+def create_redis_pool() -> InstrumentedConnectionPool:
+    return InstrumentedConnectionPool(
+        host=config.REDIS_HOST,
+        port=config.REDIS_PORT,
+        max_connections=config.REDIS_MAX_CONNECTIONS,
+        # Сколько ждать свободное соединение, прежде чем упасть с ошибкой
+        timeout=config.REDIS_POOL_TIMEOUT_IN_SECONDS,
+        socket_timeout=config.REDIS_SOCKET_TIMEOUT_IN_SECONDS,
+        socket_connect_timeout=config.REDIS_SOCKET_CONNECT_TIMEOUT_IN_SECONDS,
+        health_check_interval=config.REDIS_HEALTH_CHECK_INTERVAL_IN_SECONDS,
+    )
+
+
+def create_redis_client(pool: InstrumentedConnectionPool) -> Redis:
+    # Клиент с чужим пулом не закрывает его в close(): пул закрывается отдельно
+    return Redis(connection_pool=pool)
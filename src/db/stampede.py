@@ -0,0 +1,223 @@
+import asyncio
+import math
+import random
+import struct
+import time
+from typing import Awaitable, Callable, Optional, Union
+
+from src.core import config
+from src.db import AbstractCache
+
+__all__ = ("StampedeProtectedCache",)
+
+# Конверт записи: маркер, unix-время истечения и сколько секунд значение вычислялось
+ENTRY_HEADER = struct.Struct(">cdd")
+ENTRY_MARKER = b"\xfe"
+# Как часто ожидающий воркер проверяет, не появилось ли значение
+LOCK_POLL_INTERVAL_IN_SECONDS = 0.02
+
+
+def pack_entry(value: Union[bytes, str], expire: int, delta: float = 0.0) -> bytes:
+    if isinstance(value, str):
+        value = value.encode()
+    return ENTRY_HEADER.pack(ENTRY_MARKER, time.time() + expire, delta) + value
+
+
+def unpack_entry(entry: bytes) -> Optional[tuple[bytes, float, float]]:
+    """Вернет значение, время истечения и время вычисления; None для записей без конверта."""
+    if entry[:1] != ENTRY_MARKER or len(entry) < ENTRY_HEADER.size:
+        return None
+    _, expires_at, delta = ENTRY_HEADER.unpack_from(entry)
+    return entry[ENTRY_HEADER.size:], expires_at, delta
+
+
+class StampedeProtectedCache(AbstractCache):
+    """Обёртка над любым AbstractCache против лавины промахов (cache stampede).
+
+    Значения хранятся в конверте с временем истечения и временем вычисления,
+    а TTL каждой записи укорачивается на случайную долю до jitter, чтобы
+    положенные вместе ключи не истекали вместе. get_or_set вычисляет промах
+    один раз на воркер (single-flight) и один раз на все воркеры — под короткой
+    блокировкой, остальные ждут готовое значение. Незадолго до истечения
+    запись с растущей вероятностью пересчитывается заранее (XFetch).
+
+    Блокировки берутся в lock_cache, по умолчанию — в самом кэше; перед
+    TwoTierCache стоит передать его уровень Redis, чтобы блокировки не попадали
+    в локальный уровень и их снятие не рассылалось всем воркерам.
+    compute выполняется в отдельной задаче и доживает до конца, даже если
+    вызвавший его запрос отменён, поэтому не должен пользоваться ресурсами
+    этого запроса, например его сессией БД.
+    """
+
+    cache: AbstractCache
+
+    def __init__(
+        self,
+        cache_instance: AbstractCache,
+        lock_cache: Optional[AbstractCache] = None,
+        jitter: float = config.CACHE_EXPIRE_JITTER,
+        lock_expire: int = config.CACHE_LOCK_EXPIRE_IN_SECONDS,
+        lock_wait: float = config.CACHE_LOCK_WAIT_IN_SECONDS,
+        beta: float = config.CACHE_EARLY_REFRESH_BETA,
+    ):
+        super().__init__(cache_instance)
+        self.lock_cache = lock_cache or cache_instance
+        self.jitter = jitter
+        self.lock_expire = lock_expire
+        self.lock_wait = lock_wait
+        self.beta = beta
+        # Вычисления, которые идут сейчас в этом воркере, по ключу
+        self.loads: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.lock_waits = 0
+        self.early_refreshes = 0
+
+    def jittered(self, expire: int) -> int:
+        return max(1, round(expire * (1 - random.uniform(0, self.jitter))))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = await self.cache.get(key)
+        if entry and (unpacked := unpack_entry(entry)):
+            return unpacked[0]
+        return None
+
+    async def set(
+        self,
+        key: str,
+        value: Union[bytes, str],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ) -> None:
+        expire = self.jittered(expire)
+        await self.cache.set(key, pack_entry(value, expire), expire=expire)
+
+    async def get_many(self, keys: list[str]) -> list[Optional[bytes]]:
+        entries = await self.cache.get_many(keys)
+        values = []
+        for entry in entries:
+            unpacked = unpack_entry(entry) if entry else None
+            values.append(unpacked[0] if unpacked else None)
+        return values
+
+    async def set_many(
+        self,
+        values: dict[str, Union[bytes, str]],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ) -> None:
+        # Один TTL на вызов: ключи одного пайплайна истекут вместе,
+        # но разные вызовы разнесены по времени
+        expire = self.jittered(expire)
+        await self.cache.set_many(
+            {key: pack_entry(value, expire) for key, value in values.items()},
+            expire=expire,
+        )
+
+    async def add(
+        self,
+        key: str,
+        value: Union[bytes, str],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ) -> bool:
+        return await self.cache.add(key, pack_entry(value, expire), expire=expire)
+
+    async def delete(self, key: str) -> None:
+        await self.cache.delete(key)
+
+    async def get_or_set(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Optional[bytes]]],
+        expire: int = config.CACHE_EXPIRE_IN_SECONDS,
+    ) -> Optional[bytes]:
+        entry = await self.cache.get(key)
+        unpacked = unpack_entry(entry) if entry else None
+        if unpacked is None:
+            self.misses += 1
+            return await self.single_flight(key, compute, expire, is_locked=False)
+        value, expires_at, delta = unpacked
+        if not self.should_refresh_early(expires_at, delta):
+            self.hits += 1
+            return value
+        # Заранее пересчитывает один воркер, остальные отдают текущее значение
+        if key in self.loads or not await self.lock(key):
+            self.hits += 1
+            return value
+        self.early_refreshes += 1
+        return await self.single_flight(key, compute, expire, is_locked=True)
+
+    def should_refresh_early(self, expires_at: float, delta: float) -> bool:
+        # XFetch: чем дольше вычисление и ближе истечение, тем вероятнее пересчёт
+        return time.time() - delta * self.beta * math.log(1 - random.random()) >= expires_at
+
+    async def single_flight(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Optional[bytes]]],
+        expire: int,
+        is_locked: bool,
+    ) -> Optional[bytes]:
+        if (task := self.loads.get(key)) is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(self.load(key, compute, expire, is_locked))
+            self.loads[key] = task
+            task.add_done_callback(lambda _: self.loads.pop(key, None))
+        # Отмена одного из ожидающих запросов не отменяет вычисление для остальных
+        return await asyncio.shield(task)
+
+    async def load(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Optional[bytes]]],
+        expire: int,
+        is_locked: bool,
+    ) -> Optional[bytes]:
+        if not is_locked:
+            is_locked = await self.lock(key)
+        if not is_locked:
+            # Значение уже вычисляет другой воркер; если он не успел,
+            # вычисляем сами, чтобы не держать запрос дольше lock_wait
+            self.lock_waits += 1
+            if (value := await self.wait_for_value(key)) is not None:
+                return value
+        try:
+            started = time.monotonic()
+            value = await compute()
+            delta = time.monotonic() - started
+            if value is not None:
+                expire = self.jittered(expire)
+                await self.cache.set(key, pack_entry(value, expire, delta), expire=expire)
+            return value
+        finally:
+            if is_locked:
+                await self.lock_cache.delete(self.lock_key(key))
+
+    def lock_key(self, key: str) -> str:
+        return f"lock:{key}"
+
+    async def lock(self, key: str) -> bool:
+        return await self.lock_cache.add(self.lock_key(key), b"1",
+                                         expire=self.lock_expire)
+
+    async def wait_for_value(self, key: str) -> Optional[bytes]:
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL_IN_SECONDS)
+            if (value := await self.get(key)) is not None:
+                return value
+        return None
+
+    async def close(self) -> None:
+        await self.cache.close()
+
+    def stats(self) -> dict:
+        stats = self.cache.stats() if hasattr(self.cache, "stats") else {}
+        stats["stampede"] = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "lock_waits": self.lock_waits,
+            "early_refreshes": self.early_refreshes,
+        }
+        return stats
@@ -1,14 +1,37 @@
 from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import Column, Computed, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlmodel import Field, SQLModel
 
-__all__ = ("Post",)
+__all__ = ("Post", "post_search_vector", "POST_SEARCH_CONFIG")
+
+# Конфигурация словарей Postgres для поиска: russian стеммит и русские,
+# и английские слова
+POST_SEARCH_CONFIG = "russian"
 
 
 class Post(SQLModel, table=True):
+    # Индекс под keyset-пагинацию списка постов по (created_at, id)
+    __table_args__ = (Index("ix_post_created_at_id", "created_at", "id"),)
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str = Field(nullable=False)
     description: str = Field(nullable=False)
     views: int = Field(default=0)
     created_at: datetime = Field(default=datetime.utcnow(), nullable=False)
+
+
+# Колонку полнотекстового поиска вычисляет Postgres. Она добавляется в таблицу
+# уже после маппинга модели, поэтому select(Post) её не загружает
+post_search_vector = Column(
+    "search_vector",
+    TSVECTOR,
+    Computed(
+        f"setweight(to_tsvector('{POST_SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+        f"setweight(to_tsvector('{POST_SEARCH_CONFIG}', coalesce(description, '')), 'B')",
+        persisted=True,
+    ),
+)
+Post.__table__.append_column(post_search_vector)
+Index("ix_post_search_vector", post_search_vector, postgresql_using="gin")
@@ -19,3 +19,5 @@ class User(SQLModel, table=True):
     is_superuser: bool = Field(default=False, nullable=False)
     is_totp_enabled: bool = Field(default=False, nullable=False)
     is_active: bool = Field(default=True, nullable=False)
+    # Растёт при каждом обновлении профиля; по ней отсекаются устаревшие записи кэша
+    version: int = Field(default=1, nullable=False)
@@ -1,10 +1,9 @@
-from functools import lru_cache
-
+from asyncpg.exceptions import UniqueViolationError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from psycopg2.errors import UniqueViolation
 from sqlalchemy.exc import IntegrityError
-from sqlmodel import Session
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.api.v1.schemas import AuthUser, SignupUser
 from src.core.security import get_hash_password, verify_password
@@ -19,41 +18,41 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/login")
 
 
 class AuthService(AuthServiceMixin):
-    def register_new_user(self, user: SignupUser) -> dict:
+    async def register_new_user(self, user: SignupUser) -> dict:
         """Вернет информацию о новом созданном пользователе."""
         exception = HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
         user.email = user.email.lower()
-        hash_password = get_hash_password(user.password)
+        hash_password = await get_hash_password(user.password)
         new_user = User(username=user.username, password=hash_password,
                         email=user.email)
         try:
             self.session.add(new_user)
-            self.session.commit()
-            self.session.refresh(new_user)
+            await self.session.commit()
+            await self.session.refresh(new_user)
         except IntegrityError as error:
-            # Если username или email уже существует, отдаём 400 статус
-            assert isinstance(error.orig, UniqueViolation)
+            # Если username или email уже существует, отдаём 400 статус.
+            # asyncpg-исключение SQLAlchemy кладёт в __cause__ адаптированной ошибки
+            assert isinstance(error.orig.__cause__, UniqueViolationError)
             exception.detail = "username or email is already exists"
             raise exception
         return new_user.dict()
 
-    def authenticate_user(self, user_data: AuthUser) -> dict:
+    async def authenticate_user(self, user_data: AuthUser) -> dict:
         """Вернет информацию об аутентифицированном пользователе."""
-        user = self.session.query(User).filter(
-            User.username == user_data.username
-        ).first()
-        if not user or not verify_password(user_data.password, user.password):
+        user = (await self.session.exec(
+            select(User).where(User.username == user_data.username)
+        )).first()
+        if not user or not await verify_password(user_data.password, user.password):
             # Если пользователь не найден или пароль неправильный, отдаём 401 статус
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                                 detail="incorrect username or password")
         return user.dict()
 
 
-@lru_cache()
 def get_auth_service(
     blocked_access_tokens_cache: AbstractCache = Depends(get_access_tokens_cache),
     active_refresh_tokens_cache: ListAbstractCache = Depends(get_refresh_tokens_cache),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session)
 ) -> AuthService:
     return AuthService(blocked_access_tokens_cache=blocked_access_tokens_cache,
                        active_refresh_tokens_cache=active_refresh_tokens_cache,
@@ -1,12 +1,12 @@
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.db import AbstractCache, ListAbstractCache
 
 
 class ServiceMixin:
-    def __init__(self, cache: AbstractCache, session: Session):
+    def __init__(self, cache: AbstractCache, session: AsyncSession):
         self.cache: AbstractCache = cache
-        self.session: Session = session
+        self.session: AsyncSession = session
 
 
 class AuthServiceMixin:
@@ -14,8 +14,8 @@ class AuthServiceMixin:
         self,
         blocked_access_tokens_cache: AbstractCache,
         active_refresh_tokens_cache: ListAbstractCache,
-        session: Session
+        session: AsyncSession
     ):
         self.blocked_access_tokens_cache: AbstractCache = blocked_access_tokens_cache
         self.active_refresh_tokens_cache: ListAbstractCache = active_refresh_tokens_cache
-        self.session: Session = session
+        self.session: AsyncSession = session
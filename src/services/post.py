@@ -1,49 +1,403 @@
-import json
-from functools import lru_cache
-from typing import Optional
+import struct
+from datetime import datetime
+from typing import AsyncIterator, Optional
 
-from fastapi import Depends
-from sqlmodel import Session
+import orjson
+from asyncpg.exceptions import InterfaceError, PostgresError
+from fastapi import Depends, HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import (Integer, any_, bindparam, column, func, insert,
+                        literal_column, tuple_, update, values)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.api.v1.schemas import PostCreate, PostModel
+from src.api.v1.schemas import PostCreate, PostImport, PostModel
+from src.core import config
+from src.core.batching import BatchWriter
+from src.core.compression import gzip_compress
+from src.core.pagination import decode_cursor, encode_cursor
 from src.core.token import validate_token
-from src.db import AbstractCache, get_cache, get_session
-from src.models import Post
+from src.db import (AbstractCache, CounterAbstractCache, async_session, get_cache,
+                    get_post_views_cache, get_primary_read_session, get_read_session,
+                    get_session, get_table_versions_cache)
+from src.models import POST_SEARCH_CONFIG, Post, post_search_vector
 from src.services import ServiceMixin
 
-__all__ = ("PostService", "get_post_service")
+__all__ = (
+    "PostService",
+    "get_post_service",
+    "get_read_post_service",
+    "get_primary_read_post_service",
+    "flush_post_views",
+    "insert_posts",
+    "get_post_writer",
+)
+
+# Групповая запись постов, создаётся при старте, если включена в настройках
+post_writer: Optional[BatchWriter[PostCreate, dict]] = None
+
+
+def get_post_writer() -> Optional[BatchWriter[PostCreate, dict]]:
+    return post_writer
+
+
+# Запись кэша поста — байт версии формата, длина тела, готовое тело ответа
+# PostModel и, для тел от COMPRESSION_MINIMUM_SIZE, оно же в gzip.
+# Записи другой версии считаются промахом и перезаписываются
+POST_CACHE_VERSION = b"\x02"
+POST_CACHE_HEADER = struct.Struct(">cI")
+
+
+def encode_post(post: Post) -> bytes:
+    body = orjson.dumps(PostModel(**post.dict()).dict())
+    gzipped_body = gzip_compress(body) if len(body) >= config.COMPRESSION_MINIMUM_SIZE else b""
+    return POST_CACHE_HEADER.pack(POST_CACHE_VERSION, len(body)) + body + gzipped_body
+
+
+def decode_post(cached_post: bytes) -> Optional[tuple[bytes, Optional[bytes]]]:
+    """Вернет тело ответа и его gzip-версию, если она есть."""
+    if cached_post[:1] != POST_CACHE_VERSION or len(cached_post) < POST_CACHE_HEADER.size:
+        return None
+    _, size = POST_CACHE_HEADER.unpack_from(cached_post)
+    body_end = POST_CACHE_HEADER.size + size
+    return cached_post[POST_CACHE_HEADER.size:body_end], cached_post[body_end:] or None
+
+
+def decode_post_body(cached_post: bytes) -> Optional[bytes]:
+    decoded_post = decode_post(cached_post)
+    return decoded_post[0] if decoded_post else None
+
+
+async def split_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Разбить поток байтов тела запроса на строки."""
+    tail = b""
+    async for chunk in chunks:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    if tail:
+        yield tail
 
 
 class PostService(ServiceMixin):
-    def get_post_list(self) -> dict:
-        """Получить список постов."""
-        posts = self.session.query(Post).order_by(Post.created_at).all()
-        return {"posts": [PostModel(**post.dict()) for post in posts]}
-
-    def get_post_detail(self, item_id: int) -> Optional[dict]:
-        """Получить детальную информацию поста."""
-        if cached_post := self.cache.get(key=f"{item_id}"):
-            return json.loads(cached_post)
-
-        post = self.session.query(Post).filter(Post.id == item_id).first()
-        if post:
-            self.cache.set(key=f"{post.id}", value=post.json())
-        return post.dict() if post else None
-
-    def create_post(self, post: PostCreate, token: str) -> dict:
+    def __init__(self, cache: AbstractCache, session: AsyncSession,
+                 views_cache: CounterAbstractCache, versions_cache: CounterAbstractCache,
+                 writer: Optional[BatchWriter[PostCreate, dict]] = None):
+        super().__init__(cache=cache, session=session)
+        self.views_cache: CounterAbstractCache = views_cache
+        self.versions_cache: CounterAbstractCache = versions_cache
+        self.writer = writer
+
+    async def get_posts_version(self) -> int:
+        """Версия таблицы постов: растёт при каждом изменении, годится для ETag списка."""
+        return await self.versions_cache.get(key=config.TABLE_VERSIONS_KEY,
+                                             field=Post.__tablename__)
+
+    async def bump_posts_version(self) -> None:
+        await self.versions_cache.incr(key=config.TABLE_VERSIONS_KEY,
+                                       field=Post.__tablename__)
+
+    async def get_post_list(self, limit: int, cursor: Optional[str] = None) -> dict:
+        """Получить страницу списка постов."""
+        # Берём на одну запись больше, чтобы понять, есть ли следующая страница
+        query = select(Post).order_by(Post.created_at, Post.id).limit(limit + 1)
+        if cursor:
+            created_at, post_id = decode_cursor(cursor, size=2)
+            try:
+                created_at = datetime.fromisoformat(created_at)
+            except (TypeError, ValueError):
+                created_at = None
+            if created_at is None or not isinstance(post_id, int):
+                # Если курсор испорчен, отдаём 400 статус
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                    detail="invalid cursor")
+            # Сравнение кортежей Postgres превращает в range scan по индексу
+            query = query.where(
+                tuple_(Post.created_at, Post.id) > tuple_(created_at, post_id)
+            )
+        posts = (await self.session.exec(query)).all()
+        next_cursor = None
+        if len(posts) > limit:
+            posts = posts[:limit]
+            last_post = posts[-1]
+            next_cursor = encode_cursor(last_post.created_at.isoformat(), last_post.id)
+        return {
+            "posts": [PostModel(**post.dict()) for post in posts],
+            "next_cursor": next_cursor,
+        }
+
+    async def search_posts(self, query: str, limit: int,
+                           cursor: Optional[str] = None) -> dict:
+        """Найти посты по заголовку и описанию, от самых релевантных."""
+        ts_query = func.websearch_to_tsquery(
+            literal_column(f"'{POST_SEARCH_CONFIG}'::regconfig"), query
+        )
+        rank = func.ts_rank(post_search_vector, ts_query)
+        statement = (
+            select(Post.id, Post.title, Post.description, Post.views, Post.created_at,
+                   rank.label("rank"))
+            # @@ отбирает совпадения по GIN-индексу, ранжируются только они
+            .where(post_search_vector.op("@@")(ts_query))
+            .order_by(rank.desc(), Post.id.desc())
+            .limit(limit + 1)
+        )
+        if cursor:
+            last_rank, post_id = decode_cursor(cursor, size=2)
+            if not isinstance(last_rank, (int, float)) or not isinstance(post_id, int):
+                # Если курсор испорчен, отдаём 400 статус
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                    detail="invalid cursor")
+            statement = statement.where(tuple_(rank, Post.id) < tuple_(last_rank, post_id))
+        rows = (await self.session.execute(statement)).mappings().all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["rank"], rows[-1]["id"])
+        return {
+            "posts": [PostModel(**row) for row in rows],
+            "next_cursor": next_cursor,
+        }
+
+    async def export_posts(self) -> AsyncIterator[bytes]:
+        """Выгрузить все посты в формате NDJSON, порциями по несколько строк."""
+        # Выбираем колонки, а не ORM-объекты, чтобы identity map сессии не рос,
+        # а stream читает строки через серверный курсор
+        result = await self.session.stream(
+            select(Post.id, Post.title, Post.description, Post.views, Post.created_at)
+            .order_by(Post.created_at, Post.id)
+        )
+        async for rows in result.mappings().partitions(config.POSTS_EXPORT_CHUNK_SIZE):
+            yield b"".join(orjson.dumps(PostModel(**row).dict()) + b"\n" for row in rows)
+
+    async def get_post_detail(self, item_id: int) -> Optional[tuple[bytes, Optional[bytes]]]:
+        """Получить готовое JSON-тело ответа с детальной информацией поста
+        и, если пост большой, его же в gzip."""
+        async def load_post() -> Optional[bytes]:
+            # Вычисление промаха разделяют все ждущие его запросы воркера, поэтому
+            # сессия своя: отмена начавшего его запроса закрыла бы свою сессию
+            # под остальными. Привязка та же — основная БД или реплика
+            async with async_session(bind=self.session.bind) as session:
+                post = (await session.exec(select(Post).where(Post.id == item_id))).first()
+            return encode_post(post) if post else None
+
+        # Промах одного популярного поста вычисляется один раз на все запросы
+        cached_post = await self.cache.get_or_set(key=f"{item_id}", compute=load_post)
+        if not cached_post:
+            return None
+        if (decoded_post := decode_post(cached_post)) is None:
+            # Запись другой версии формата перезаписываем
+            cached_post = await load_post()
+            if not cached_post:
+                return None
+            await self.cache.set(key=f"{item_id}", value=cached_post)
+            decoded_post = decode_post(cached_post)
+        await self.count_view(item_id)
+        return decoded_post
+
+    async def get_post_batch(self, item_ids: list[int]) -> bytes:
+        """Получить готовое JSON-тело со списком постов в порядке item_ids.
+
+        Кэш читается одним MGET, промахи добираются одним SQL-запросом
+        и одним пайплайном кладутся обратно в кэш.
+        """
+        cached_posts = await self.cache.get_many([f"{item_id}" for item_id in item_ids])
+        bodies = {}
+        for item_id, cached_post in zip(item_ids, cached_posts):
+            if cached_post and (body := decode_post_body(cached_post)):
+                bodies[item_id] = body
+
+        missing_ids = list({item_id for item_id in item_ids if item_id not in bodies})
+        if missing_ids:
+            # Один параметр-массив вместо IN со списком: план не зависит от размера
+            ids = bindparam("ids", value=missing_ids, type_=ARRAY(Integer))
+            posts = (await self.session.exec(select(Post).where(Post.id == any_(ids)))).all()
+            fresh_posts = {f"{post.id}": encode_post(post) for post in posts}
+            if fresh_posts:
+                await self.cache.set_many(fresh_posts)
+            for post in posts:
+                bodies[post.id] = decode_post_body(fresh_posts[f"{post.id}"])
+
+        not_found = [item_id for item_id in item_ids if item_id not in bodies]
+        return b"".join((
+            b'{"posts":[',
+            b",".join(bodies.get(item_id, b"null") for item_id in item_ids),
+            b'],"not_found":',
+            orjson.dumps(not_found),
+            b"}",
+        ))
+
+    async def count_view(self, item_id: int) -> None:
+        """Учесть просмотр поста; в Postgres его запишет flush_post_views."""
+        await self.views_cache.incr(key=config.POST_VIEWS_KEY, field=f"{item_id}")
+
+    async def import_posts(self, lines: AsyncIterator[bytes], token: str) -> dict:
+        """Загрузить посты из NDJSON через COPY пачками по POSTS_IMPORT_CHUNK_SIZE.
+
+        Каждая пачка коммитится отдельно, поэтому ошибка в одной из них
+        не откатывает уже загруженные.
+        """
+        validate_token(token)
+        result = {"inserted": 0, "failed": 0, "errors": []}
+
+        def add_error(line_number: int, errors: list[dict], count: int = 1) -> None:
+            result["failed"] += count
+            if len(result["errors"]) < config.POSTS_IMPORT_MAX_ERRORS:
+                result["errors"].append({"line": line_number, "errors": errors})
+
+        async def copy_chunk(chunk: list[tuple[int, PostImport]]) -> None:
+            try:
+                result["inserted"] += await self._copy_posts([post for _, post in chunk])
+            # Кроме ошибок Postgres — ошибки кодирования записей в asyncpg:
+            # одна плохая строка не должна обрывать весь импорт
+            except (PostgresError, InterfaceError, TypeError, ValueError) as error:
+                await self.session.rollback()
+                # Пачка откатилась целиком; ошибку вешаем на её первую строку
+                add_error(chunk[0][0], [{"msg": str(error), "type": type(error).__name__}],
+                          count=len(chunk))
+
+        chunk: list[tuple[int, PostImport]] = []
+        line_number = 0
+        async for line in split_lines(lines):
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                chunk.append((line_number, PostImport.parse_raw(line)))
+            except ValidationError as error:
+                add_error(line_number, error.errors())
+                continue
+            if len(chunk) >= config.POSTS_IMPORT_CHUNK_SIZE:
+                await copy_chunk(chunk)
+                chunk = []
+        if chunk:
+            await copy_chunk(chunk)
+        return result
+
+    async def _copy_posts(self, posts: list[PostImport]) -> int:
+        """Записать пачку постов одним COPY, закоммитить и положить их в кэш."""
+        # COPY идёт напрямую через соединение asyncpg, но внутри транзакции
+        # сессии: её BEGIN уже отправлен, и без commit сессии пачка откатится
+        connection = await self.session.connection()
+        driver_connection = (await connection.get_raw_connection()).driver_connection
+        # COPY не умеет RETURNING, поэтому id берём из последовательности заранее
+        ids = await driver_connection.fetch(
+            "SELECT nextval(pg_get_serial_sequence('post', 'id')) "
+            "FROM generate_series(1, $1)",
+            len(posts),
+        )
+        new_posts = [
+            Post(id=row[0], **post.dict(exclude_none=True)) for row, post in zip(ids, posts)
+        ]
+        columns = ("id", "title", "description", "views", "created_at")
+        await driver_connection.copy_records_to_table(
+            Post.__tablename__,
+            records=[tuple(getattr(post, name) for name in columns) for post in new_posts],
+            columns=columns,
+        )
+        await self.session.commit()
+        # В кэш — только после commit, иначе откат оставил бы в нём несуществующие посты
+        await self.cache.set_many({f"{post.id}": encode_post(post) for post in new_posts})
+        await self.bump_posts_version()
+        return len(new_posts)
+
+    async def create_post(self, post: PostCreate, token: str) -> dict:
         """Создать пост."""
         validate_token(token)
+        if self.writer is not None:
+            # Пост запишется вместе с постами других запросов одним INSERT
+            return await self.writer.submit(post)
         new_post = Post(title=post.title, description=post.description)
         self.session.add(new_post)
-        self.session.commit()
-        self.session.refresh(new_post)
+        await self.session.commit()
+        await self.session.refresh(new_post)
+        await self.bump_posts_version()
         return new_post.dict()
 
 
-# get_post_service — это провайдер PostService. Синглтон
-@lru_cache()
+async def insert_posts(posts: list[PostCreate]) -> list[dict]:
+    """Записать пачку постов одним INSERT ... RETURNING и одним commit."""
+    rows = [
+        Post(title=post.title, description=post.description).dict(exclude={"id"})
+        for post in posts
+    ]
+    # Postgres возвращает строки многострочного INSERT в порядке VALUES
+    query = insert(Post).values(rows).returning(
+        Post.id, Post.title, Post.description, Post.views, Post.created_at
+    )
+    async with async_session() as session:
+        result = await session.execute(query)
+        new_posts = [dict(row) for row in result.mappings()]
+        await session.commit()
+    await get_table_versions_cache().incr(key=config.TABLE_VERSIONS_KEY,
+                                          field=Post.__tablename__)
+    return new_posts
+
+
+async def flush_post_views() -> None:
+    """Перенести накопленные в Redis просмотры в Postgres одним UPDATE на пачку."""
+    views_cache = get_post_views_cache()
+    views = await views_cache.pop_all(key=config.POST_VIEWS_KEY)
+    if not views:
+        return
+    rows = [(int(post_id), amount) for post_id, amount in views.items()]
+    try:
+        async with async_session() as session:
+            for start in range(0, len(rows), config.POST_VIEWS_FLUSH_BATCH_SIZE):
+                # UPDATE post SET views = views + delta FROM (VALUES ...) AS deltas
+                deltas = values(
+                    column("id", Integer), column("delta", Integer), name="deltas"
+                ).data(rows[start:start + config.POST_VIEWS_FLUSH_BATCH_SIZE])
+                await session.execute(
+                    update(Post)
+                    .where(Post.id == deltas.c.id)
+                    .values(views=func.coalesce(Post.views, 0) + deltas.c.delta)
+                    .execution_options(synchronize_session=False)
+                )
+            await session.commit()
+    except Exception:
+        # Возвращаем просмотры в Redis, чтобы не потерять их до следующего сброса
+        await views_cache.incr_many(key=config.POST_VIEWS_KEY, amounts=views)
+        raise
+    # Просмотры входят в тело списка, поэтому его ETag тоже меняется
+    await get_table_versions_cache().incr(key=config.TABLE_VERSIONS_KEY,
+                                          field=Post.__tablename__)
+
+
+# get_post_service — это провайдер PostService. Сервис дешевый и создаётся
+# на каждый запрос вместе со своей сессией
 def get_post_service(
     cache: AbstractCache = Depends(get_cache),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
+    views_cache: CounterAbstractCache = Depends(get_post_views_cache),
+    versions_cache: CounterAbstractCache = Depends(get_table_versions_cache),
+    writer: Optional[BatchWriter[PostCreate, dict]] = Depends(get_post_writer),
+) -> PostService:
+    return PostService(cache=cache, session=session, views_cache=views_cache,
+                       versions_cache=versions_cache, writer=writer)
+
+
+# get_read_post_service — то же самое, но для запросов только на чтение:
+# сессия идёт в реплику, если клиент недавно ничего не записывал
+def get_read_post_service(
+    cache: AbstractCache = Depends(get_cache),
+    session: AsyncSession = Depends(get_read_session),
+    views_cache: CounterAbstractCache = Depends(get_post_views_cache),
+    versions_cache: CounterAbstractCache = Depends(get_table_versions_cache),
+) -> PostService:
+    return PostService(cache=cache, session=session, views_cache=views_cache,
+                       versions_cache=versions_cache)
+
+
+# get_primary_read_post_service — сервис только для чтения, но всегда
+# с основной БД: для ответов с ETag по версии таблицы постов. Реплика могла бы
+# отдать старую страницу с ETag новой версии, и клиент получал бы 304 на неё
+def get_primary_read_post_service(
+    cache: AbstractCache = Depends(get_cache),
+    session: AsyncSession = Depends(get_primary_read_session),
+    views_cache: CounterAbstractCache = Depends(get_post_views_cache),
+    versions_cache: CounterAbstractCache = Depends(get_table_versions_cache),
 ) -> PostService:
-    return PostService(cache=cache, session=session)
+    return PostService(cache=cache, session=session, views_cache=views_cache,
+                       versions_cache=versions_cache)
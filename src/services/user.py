@@ -1,85 +1,165 @@
-from functools import lru_cache
+from typing import Optional
 
+from asyncpg.exceptions import UniqueViolationError
 from fastapi import Depends, HTTPException, status
-from psycopg2.errors import UniqueViolation
 from sqlalchemy.exc import IntegrityError
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.api.v1.schemas import UserUpdate
+from src.api.v1.schemas import UserProfile, UserUpdate
+from src.core import config
 from src.core.security import get_hash_password
-from src.core.token import validate_token
+from src.core.token import create_tokens, validate_token
 from src.db import (AbstractCache, ListAbstractCache, get_access_tokens_cache,
-                    get_refresh_tokens_cache, get_session)
+                    get_read_session, get_refresh_tokens_cache, get_session,
+                    get_user_cache)
 from src.models import User
 from src.services import AuthServiceMixin
 
-__all__ = ("UserService", "get_user_service")
+__all__ = ("UserService", "get_user_service", "get_read_user_service")
 
 
 class UserService(AuthServiceMixin):
-    def get_current_user(self, token: str,
-                         is_refresh_token: bool = False) -> dict:
+    def __init__(
+        self,
+        blocked_access_tokens_cache: AbstractCache,
+        active_refresh_tokens_cache: ListAbstractCache,
+        session: AsyncSession,
+        user_cache: AbstractCache,
+    ):
+        super().__init__(blocked_access_tokens_cache=blocked_access_tokens_cache,
+                         active_refresh_tokens_cache=active_refresh_tokens_cache,
+                         session=session)
+        self.user_cache: AbstractCache = user_cache
+
+    async def get_user_profile(self, user_uuid: str,
+                               min_version: int = 0) -> Optional[UserProfile]:
+        """Профиль пользователя из кэша; из БД, только если в кэше его нет
+        или версия в кэше старше min_version (версии из токена)."""
+        cached_user = await self.user_cache.get(key=user_uuid)
+        if cached_user:
+            profile = UserProfile.parse_raw(cached_user)
+            if profile.version >= min_version:
+                return profile
+        user = await self.session.get(User, user_uuid)
+        if not user:
+            return None
+        profile = UserProfile(**user.dict())
+        await self.user_cache.set(key=user_uuid, value=profile.json(),
+                                  expire=config.USER_CACHE_EXPIRE_IN_SECONDS)
+        return profile
+
+    async def get_current_user(self, token: str) -> dict:
         """Вернет информацию об аутентифицированном пользователе."""
         exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
         payload = validate_token(token)
         user_uuid = payload.get("user_uuid")
-        if is_refresh_token:
-            refresh_jti = payload.get("jti")
-            is_active_token = self.active_refresh_tokens_cache.find(key=user_uuid,
-                                                                    value=refresh_jti)
-            if not is_active_token:
-                # Если токен не активен, отдаём 401 статус
-                exception.detail = "the refresh token is expired"
-                raise exception
-        else:
-            access_jti = payload.get("jti")
-            blocked_token = self.blocked_access_tokens_cache.get(key=access_jti)
-            if blocked_token:
-                # Если токен заблокирован, отдаём 401 статус
-                exception.detail = "the access token is expired"
-                raise exception
-        user = self.session.get(User, user_uuid)
-        if not user:
+        access_jti = payload.get("jti")
+        blocked_token = await self.blocked_access_tokens_cache.get(key=access_jti)
+        if blocked_token:
+            # Если токен заблокирован, отдаём 401 статус
+            exception.detail = "the access token is expired"
+            raise exception
+        profile = await self.get_user_profile(user_uuid,
+                                              min_version=payload.get("version", 0))
+        if not profile:
+            # Если пользователь не найден, отдаём 401 статус
+            raise exception
+        return profile.dict()
+
+    async def refresh_tokens(self, refresh_token: str) -> dict:
+        """Вернет новые токены взамен активного refresh-токена."""
+        exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+        payload = validate_token(refresh_token)
+        user_uuid = payload.get("user_uuid")
+        profile = await self.get_user_profile(user_uuid,
+                                              min_version=payload.get("version", 0))
+        if not profile:
             # Если пользователь не найден, отдаём 401 статус
             raise exception
-        return user.dict()
+        tokens, claims = create_tokens(profile)
+        # Проверка старого токена и регистрация нового — один атомарный вызов
+        is_active_token = await self.active_refresh_tokens_cache.exchange(
+            key=user_uuid,
+            old_value=payload.get("jti"),
+            new_value=claims["refresh_token"]["jti"],
+            expire_at=claims["refresh_token"]["exp"],
+        )
+        if not is_active_token:
+            # Если токен не активен, отдаём 401 статус
+            exception.detail = "the refresh token is expired"
+            raise exception
+        return tokens
 
-    def update_user(self, access_token: str, new_data: UserUpdate) -> dict:
-        """Вернет обновленную информацию об аутентифицированном пользователе."""
+    async def update_user(self, access_token: str,
+                          new_data: UserUpdate) -> tuple[dict, dict]:
+        """Вернет обновленную информацию об аутентифицированном пользователе
+        и новые токены взамен текущих."""
         payload = validate_token(access_token)
         access_jti = payload.get("jti")
-        blocked_token = self.blocked_access_tokens_cache.get(key=access_jti)
+        blocked_token = await self.blocked_access_tokens_cache.get(key=access_jti)
         if blocked_token:
             # Если токен заблокирован, отдаём 401 статус
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                                 detail="the access token is expired")
         user_uuid = payload.get("user_uuid")
-        user = self.session.get(User, user_uuid)
+        user = await self.session.get(User, user_uuid)
         for key, value in new_data.dict(exclude_unset=True).items():
             if key == "password" and value:
-                value = get_hash_password(value)
+                value = await get_hash_password(value)
             if value:
                 setattr(user, key, value)
+        # Версию увеличивает сам UPDATE, чтобы параллельные обновления не совпали
+        user.version = User.version + 1
         try:
             self.session.add(user)
-            self.session.commit()
-            self.session.refresh(user)
+            await self.session.commit()
+            await self.session.refresh(user)
         except IntegrityError as error:
             # Если username или email уже существует, отдаём 400 статус
-            assert isinstance(error.orig, UniqueViolation)
+            assert isinstance(error.orig.__cause__, UniqueViolationError)
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                                 detail="username or email is already exists")
-        access_jti = payload.get("jti")
-        self.blocked_access_tokens_cache.set(key=access_jti, value="block")
-        return user.dict()
+        profile = UserProfile(**user.dict())
+        tokens, claims = create_tokens(profile)
+        # Блокировка старого access-токена и замена его refresh-токена новым —
+        # один атомарный вызов
+        is_revoked = await self.active_refresh_tokens_cache.revoke(
+            key=user_uuid,
+            access_jti=access_jti,
+            refresh_jti=payload.get("refresh_jti"),
+            new_refresh_jti=claims["refresh_token"]["jti"],
+            expire_at=claims["refresh_token"]["exp"],
+        )
+        # Остальные воркеры выбросят старый профиль из локального кэша,
+        # а в Redis сразу ложится новая версия
+        await self.user_cache.delete(key=user_uuid)
+        await self.user_cache.set(key=user_uuid, value=profile.json(),
+                                  expire=config.USER_CACHE_EXPIRE_IN_SECONDS)
+        if not is_revoked:
+            # Токен заблокировал параллельный выход: изменения сохранены,
+            # но новые токены не выдаём, отдаём 401 статус
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                                detail="the access token is expired")
+        return user.dict(), tokens
 
 
-@lru_cache()
 def get_user_service(
     blocked_access_tokens_cache: AbstractCache = Depends(get_access_tokens_cache),
     active_refresh_tokens_cache: ListAbstractCache = Depends(get_refresh_tokens_cache),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session),
+    user_cache: AbstractCache = Depends(get_user_cache),
+) -> UserService:
+    return UserService(blocked_access_tokens_cache=blocked_access_tokens_cache,
+                       active_refresh_tokens_cache=active_refresh_tokens_cache,
+                       session=session, user_cache=user_cache)
+
+
+def get_read_user_service(
+    blocked_access_tokens_cache: AbstractCache = Depends(get_access_tokens_cache),
+    active_refresh_tokens_cache: ListAbstractCache = Depends(get_refresh_tokens_cache),
+    session: AsyncSession = Depends(get_read_session),
+    user_cache: AbstractCache = Depends(get_user_cache),
 ) -> UserService:
     return UserService(blocked_access_tokens_cache=blocked_access_tokens_cache,
                        active_refresh_tokens_cache=active_refresh_tokens_cache,
-                       session=session)
+                       session=session, user_cache=user_cache)